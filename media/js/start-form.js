@@ -16,6 +16,68 @@ $(document).ready(
 			}
 		);
 		
+		$('select#id_plan_copy[data-search-url]').each(
+			function() {
+				var select = $(this);
+				var url = select.attr('data-search-url');
+				var search = $('<input type="text" id="goal-search" autocomplete="off" />');
+				var results = $('<ul id="goal-search-results"></ul>').hide();
+				var timer = null;
+				
+				search.attr('placeholder', 'or search for a goal');
+				select.after(results).after(search);
+				
+				search.bind('keyup',
+					function(e) {
+						var query = $(this).val();
+						
+						if(timer) {
+							clearTimeout(timer);
+						}
+						
+						if(query.length < 2) {
+							results.hide();
+							return;
+						}
+						
+						timer = setTimeout(
+							function() {
+								$.getJSON(url, {'q': query},
+									function(goals) {
+										results.empty();
+										
+										$.each(goals,
+											function(i, goal) {
+												var item = $('<li></li>').text(goal.name);
+												
+												item.bind('click',
+													function(e) {
+														if(select.find('option[value=' + goal.id + ']').length == 0) {
+															select.prepend(
+																$('<option></option>').val(goal.id).text(goal.name)
+															);
+														}
+														
+														select.val(goal.id);
+														search.val('');
+														results.hide();
+													}
+												);
+												
+												results.append(item);
+											}
+										);
+										
+										results.toggle(goals.length > 0);
+									}
+								);
+							}, 200
+						);
+					}
+				);
+			}
+		);
+		
 		$('input[type=radio][name=signup-create_account]').bind('change',
 			function(e) {
 				$('label[for=id_signup-password_confirm]').parent().slideToggle();
@@ -2,7 +2,8 @@
 # encoding: utf-8
 
 from django.contrib import admin
-from transphorm.goals.models import Profile, Goal, Plan, Action, Reward, Milestone, LogEntry, Comment, RewardClaim, UserEmail
+from transphorm.goals.models import Profile, Goal, Plan, Action, Reward, Milestone, LogEntry, Comment, RewardClaim, UserEmail, \
+	CronCheckpoint
 
 class ProfileAdmin(admin.ModelAdmin):
 	list_display = (
@@ -19,6 +20,15 @@ class GoalAdmin(admin.ModelAdmin):
 	list_display = ('name', 'user', 'slug', 'has_deadline', 'live')
 	list_filter = ('live',)
 
+class UserEmailAdmin(admin.ModelAdmin):
+	list_display = (
+		'subject', 'plan', 'kind', 'date', 'status', 'attempts',
+		'next_attempt_at'
+	)
+	
+	list_filter = ('status', 'kind')
+	date_hierarchy = 'date'
+
 admin.site.register(Profile, ProfileAdmin)
 admin.site.register(Goal, GoalAdmin)
 admin.site.register(Plan)
@@ -28,4 +38,5 @@ admin.site.register(RewardClaim)
 admin.site.register(Milestone)
 admin.site.register(LogEntry)
 admin.site.register(Comment)
-admin.site.register(UserEmail)
\ No newline at end of file
+admin.site.register(UserEmail, UserEmailAdmin)
+admin.site.register(CronCheckpoint)
\ No newline at end of file
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.core.cache import cache
+import time
+
+# Versions should outlive the things cached against them
+VERSION_TIMEOUT = 60 * 60 * 24 * 30
+
+def new_version():
+	# Start from the current time rather than 1, so if a version is evicted
+	# from the cache we don't go back to keys used before it was
+	return int(time.time() * 1000)
+
+def get_version(name):
+	"""
+	Return the current version of a named set of data. Fold this into cache
+	keys, and bump it to invalidate everything cached against the old one.
+	"""
+	
+	key = 'version_%s' % name
+	version = cache.get(key)
+	
+	if version is None:
+		cache.add(key, new_version(), VERSION_TIMEOUT)
+		version = cache.get(key)
+	
+	return version
+
+def get_versions(*names):
+	"""
+	Return a dictionary of the current versions of several named sets of
+	data, read from the cache in one go
+	"""
+	
+	versions = cache.get_many(['version_%s' % name for name in names])
+	versions = dict(
+		[
+			(name, versions.get('version_%s' % name))
+			for name in names
+		]
+	)
+	
+	for name, version in versions.items():
+		if version is None:
+			versions[name] = get_version(name)
+	
+	return versions
+
+def bump_version(name):
+	"""
+	Move a named set of data on to a new version
+	"""
+	
+	key = 'version_%s' % name
+	
+	try:
+		return cache.incr(key)
+	except ValueError:
+		version = new_version()
+		cache.set(key, version, VERSION_TIMEOUT)
+		return version
+
+def acquire_lock(name, timeout = 30):
+	"""
+	Try to take a short-lived lock, returning True if it was taken. The lock
+	is released automatically after the timeout, in case its holder dies.
+	"""
+	
+	return cache.add('lock_%s' % name, 1, timeout)
+
+def release_lock(name):
+	cache.delete('lock_%s' % name)
+
+def count(name, amount = 1):
+	"""
+	Add to a named counter in the cache
+	"""
+	
+	if not amount:
+		return
+	
+	key = 'count_%s' % name
+	cache.add(key, 0, VERSION_TIMEOUT)
+	
+	try:
+		cache.incr(key, amount)
+	except ValueError:
+		pass
+
+def get_counts(*names):
+	"""
+	Return a dictionary of the values of the named counters
+	"""
+	
+	counts = cache.get_many(['count_%s' % name for name in names])
+	return dict(
+		[(name, counts.get('count_%s' % name, 0)) for name in names]
+	)
+
+def cached(name, func, timeout = None):
+	"""
+	Return the value cached against the current version of the given name,
+	calling func to work it out if it isn't there
+	"""
+	
+	key = 'cached_%s_%s' % (name, get_version(name))
+	value = cache.get(key)
+	
+	if value is None:
+		value = func()
+		cache.set(key, value, timeout)
+	
+	return value
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.conf import settings
+from django.utils.hashcompat import sha_constructor
+from django.utils.html import escape
+import os
+
+CHART_DIR = 'charts'
+
+def chart_path(name):
+	"""
+	Return the path to a rendered chart under MEDIA_ROOT
+	"""
+	
+	return os.path.join(
+		getattr(settings, 'MEDIA_ROOT'), CHART_DIR, '%s.svg' % name
+	)
+
+def chart_name(*args):
+	"""
+	Return a name for a chart based on everything that goes into drawing it,
+	so a chart only needs rendering again when its data changes
+	"""
+	
+	return sha_constructor(repr(args)).hexdigest()
+
+def line_chart(series, width, height, colours, labels = None):
+	"""
+	Render a line chart as SVG, with one line per series of values. All the
+	series should be the same length, and the optional labels are shown
+	along the x axis, one per value.
+	"""
+	
+	label_height = labels and 12 or 0
+	plot_height = height - label_height - 2
+	values = [v for s in series for v in s] or [0]
+	bottom = min(min(values), 0)
+	scale = (max(values) - bottom) or 1
+	
+	length = max([len(s) for s in series] + [len(labels or [])])
+	if length > 1:
+		step = (width - 1) / float(length - 1)
+	else:
+		step = 0
+	
+	def x(i):
+		return 0.5 + i * step
+	
+	def y(value):
+		return 1 + plot_height - (value - bottom) * plot_height / float(scale)
+	
+	svg = [
+		'<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" ' \
+		'viewBox="0 0 %d %d">' % (width, height, width, height)
+	]
+	
+	for i, data in enumerate(series):
+		svg.append(
+			'<polyline fill="none" stroke="#%s" stroke-width="2" ' \
+			'points="%s" />' % (
+				colours[i % len(colours)],
+				' '.join(
+					['%.1f,%.1f' % (x(j), y(v)) for (j, v) in enumerate(data)]
+				)
+			)
+		)
+	
+	for i, label in enumerate(labels or []):
+		svg.append(
+			'<text x="%.1f" y="%d" font-family="Arial, Helvetica, ' \
+			'sans-serif" font-size="9" fill="#666" text-anchor="%s">%s' \
+			'</text>' % (
+				x(i), height - 2,
+				i == 0 and 'start' or (i == length - 1 and 'end' or 'middle'),
+				escape(label)
+			)
+		)
+	
+	svg.append('</svg>')
+	return '\n'.join(svg)
+
+def render_chart(name, *args, **kwargs):
+	"""
+	Render a line chart to the on-disk cache under the given name, unless
+	it's already been rendered
+	"""
+	
+	path = chart_path(name)
+	if os.path.exists(path):
+		# Touch the file, so clean_charts can tell it's still being used
+		try:
+			os.utime(path, None)
+			return path
+		except OSError:
+			pass
+	
+	directory = os.path.dirname(path)
+	if not os.path.exists(directory):
+		try:
+			os.makedirs(directory)
+		except OSError:
+			pass
+	
+	# Write to a temporary file first, so nothing is served half-written
+	temp_path = '%s.%d.tmp' % (path, os.getpid())
+	f = open(temp_path, 'w')
+	
+	try:
+		f.write(line_chart(*args, **kwargs))
+	finally:
+		f.close()
+	
+	os.rename(temp_path, path)
+	return path
+
+def clean_charts(max_age):
+	"""
+	Delete rendered charts (and any half-written temporary files) that haven't
+	been used in the last max_age seconds. Returns the number deleted.
+	"""
+	
+	from time import time
+	
+	directory = os.path.join(getattr(settings, 'MEDIA_ROOT'), CHART_DIR)
+	if not os.path.exists(directory):
+		return 0
+	
+	cutoff = time() - max_age
+	deleted = 0
+	
+	for filename in os.listdir(directory):
+		if not filename.endswith('.svg') and not filename.endswith('.tmp'):
+			continue
+		
+		path = os.path.join(directory, filename)
+		try:
+			if os.path.getmtime(path) < cutoff:
+				os.remove(path)
+				deleted += 1
+		except OSError:
+			pass
+	
+	return deleted
@@ -1,39 +1,129 @@
 #!/usr/bin/env python
 # encoding: utf-8
 
+# Number of seconds to keep the latest plans and entries, in case a change
+# slips past the signals that refresh them
+LATEST_TIMEOUT = 60 * 10
+
+class Lazy(object):
+	"""
+	Stands in for the value a function returns. The function is only called
+	once a template uses the value (by looping over it, testing it, looking
+	up one of its attributes or printing it), and then only once.
+	
+	Django's templates don't call values they find in the context, only
+	attributes, so the value has to be proxied rather than left for the
+	template to call.
+	"""
+	
+	def __init__(self, func):
+		self.func = func
+		self.called = False
+	
+	def __call__(self):
+		if not self.called:
+			self.value = self.func()
+			self.called = True
+		
+		return self.value
+	
+	def __getattr__(self, name):
+		if name.startswith('__') or name in ('func', 'called', 'value'):
+			raise AttributeError(name)
+		
+		return getattr(self(), name)
+	
+	def __getitem__(self, key):
+		return self()[key]
+	
+	def __iter__(self):
+		return iter(self())
+	
+	def __len__(self):
+		# The {% for %} tag takes the length of anything that has one, and
+		# forms can be looped over but have no length of their own
+		value = self()
+		if hasattr(value, '__len__'):
+			return len(value)
+		
+		return len(list(value))
+	
+	def __nonzero__(self):
+		return bool(self())
+	
+	def __unicode__(self):
+		return unicode(self())
+	
+	def __str__(self):
+		return str(self())
+
+def latest_plans():
+	from transphorm.goals.models import Plan
+	from django.db.models import Q
+	
+	return list(
+		Plan.objects.filter(
+			Q(user__profile__public = True) | Q(user__profile__isnull = True)
+		).filter(live = True).select_related('user', 'goal')[:5]
+	)
+
+def latest_log_entries():
+	from transphorm.goals.models import LogEntry
+	from transphorm.goals.helpers import prefetch_entries
+	from django.db.models import Q
+	
+	return prefetch_entries(
+		LogEntry.objects.approved().filter(
+			Q(plan__user__profile__public = True) | Q(plan__user__profile__isnull = True)
+		).filter(plan__live = True).select_related(
+			'plan__user', 'plan__goal', 'comment'
+		)[:10]
+	)
+
 def goals(request):
-	from transphorm.goals.models import Plan, Profile, Reward, LogEntry
+	from transphorm.goals.models import Profile, Reward
 	from transphorm.goals.forms import StartForm
-	from django.db.models import Q
+	from transphorm.goals.caching import cached
+	from transphorm.goals.templatetags.entrycache import prefetch_fragments
 	from django.conf import settings
 	
+	# The latest plans and entries are the same for everyone, so they're
+	# shared through the cache, and refreshed when plans or entries change
 	context = {
-		'latest_plans': Plan.objects.filter(
-			Q(user__profile__public = True) | Q(user__profile__isnull = True)
-		).filter(live = True)[:5],
+		'latest_plans': Lazy(
+			lambda: cached('latest_plans', latest_plans, LATEST_TIMEOUT)
+		),
 		
-		'start_form': StartForm(),
+		'start_form': Lazy(StartForm),
 		
-		'latest_log_entries': LogEntry.objects.approved().filter(
-			Q(plan__user__profile__public = True) | Q(plan__user__profile__isnull = True)
-		).filter(plan__live = True)[:10]
+		'latest_log_entries': Lazy(
+			lambda: prefetch_fragments(
+				request, cached(
+					'latest_log_entries', latest_log_entries, LATEST_TIMEOUT
+				)
+			)
+		)
 	}
 	
 	if request.GET.get('msg'):
 		context['anonymous_messages'] = [request.GET.get('msg')]
 	
 	if request.user.is_authenticated():
-		context['user_plans'] = request.user.plans.filter(live = True)
+		def get_profile():
+			try:
+				return request.user.get_profile()
+			except Profile.DoesNotExist:
+				return None
 		
-		try:
-			context['profile'] = request.user.get_profile()
-		except Profile.DoesNotExist:
-			pass
+		context['user_plans'] = Lazy(
+			lambda: request.user.plans.filter(live = True)
+		)
 		
-		context['unclaimed_rewards'] = Reward.objects.unclaimed(
-			request.user
+		context['profile'] = Lazy(get_profile)
+		context['unclaimed_rewards'] = Lazy(
+			lambda: Reward.objects.unclaimed(request.user)
 		)
 	
 	context['GA_ACCOUNT_ID'] = getattr(settings, 'GA_ACCOUNT_ID', None)
 	
-	return context
\ No newline at end of file
+	return context
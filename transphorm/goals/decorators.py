@@ -28,6 +28,118 @@ def goal_view():
 		return inner_decorator
 	return decorator
 
+# The profile fields fetched along with a plan
+PROFILE_FIELDS = (
+	'id', 'dob', 'gender', 'about', 'public', 'twitter', 'website'
+)
+
+def get_plan(request, slug, username = None):
+	"""
+	Return the live plan for the goal with the given slug and the user with
+	the given username (or the logged-in user), or None if there isn't one.
+	The plan comes with its goal, user and user's profile, all fetched in a
+	single query, and is remembered for the rest of the request.
+	"""
+	
+	from django.db import connection
+	from transphorm.goals.models import Profile
+	
+	plans = getattr(request, '_plans', None)
+	if plans is None:
+		plans = request._plans = {}
+	
+	if (slug, username) in plans:
+		return plans[(slug, username)]
+	
+	qn = connection.ops.quote_name
+	opts = Profile._meta
+	
+	queryset = Plan.objects.filter(
+		live = True, goal__slug = slug
+	).select_related('user', 'goal').extra(
+		select = dict(
+			[
+				(
+					'profile_%s' % name,
+					'SELECT %s FROM %s WHERE %s.user_id = %s.user_id' % (
+						qn(opts.get_field(name).column),
+						qn(opts.db_table), qn(opts.db_table),
+						qn(Plan._meta.db_table)
+					)
+				) for name in PROFILE_FIELDS
+			]
+		)
+	)
+	
+	if username is None:
+		queryset = queryset.filter(user = request.user)
+	else:
+		queryset = queryset.filter(user__username = username)
+	
+	try:
+		plan = queryset.latest()
+	except Plan.DoesNotExist:
+		plan = None
+	
+	if not plan is None:
+		if request.user.is_authenticated() and plan.user_id == request.user.pk:
+			plan.user = request.user
+		
+		# Cache the profile where User.get_profile() looks for it
+		if not plan.profile_id is None:
+			plan.user._profile_cache = Profile(
+				user = plan.user, **dict(
+					[
+						(
+							name, opts.get_field(name).to_python(
+								getattr(plan, 'profile_%s' % name)
+							)
+						) for name in PROFILE_FIELDS
+					]
+				)
+			)
+	
+	plans[(slug, username)] = plan
+	return plan
+
+def plan_not_found(request, slug, username, edit):
+	"""
+	Work out why a plan couldn't be found, and respond accordingly
+	"""
+	
+	try:
+		goal = Goal.objects.get(slug = slug)
+	except Goal.DoesNotExist:
+		return HttpResponseRedirect(
+			'%s?name=%s' % (
+				reverse('new_goal'),
+				slug.replace('-', ' ')
+			)
+		)
+	
+	if not username is None:
+		user = get_object_or_404(User, username = username)
+	elif request.user.is_authenticated():
+		user = request.user
+	else:
+		return HttpResponseRedirect(
+			reverse('start_plan', args = [slug])
+		)
+	
+	if edit:
+		return HttpResponseRedirect(
+			reverse('start_plan', args = [goal.slug])
+		)
+	
+	return render_to_response(
+		'plan/not-attempting.html',
+		{
+			'user': user,
+			'live_plans': user.plans.filter(live = True)
+		},
+		RequestContext(request)
+	)
+
 def plan_view(*args, **kwargs):
 	def decorator(func):
 		def get_outer_arg(name, default = None):
@@ -37,71 +149,40 @@ def plan_view(*args, **kwargs):
 			edit = get_outer_arg('edit')
 			detail = get_outer_arg('detail')
 			
-			try:
-				if len(args) >= 1:
-					slug = args.pop(0)
-				else:
-					slug = kwargs.pop('goal')
-				
-				goal = Goal.objects.get(slug = slug)
-				try:
-					if len(args) > 1 and not args[1] is None:
-						user = get_object_or_404(
-							User, username = args.pop(1)
-						)
-					elif 'username' in kwargs:
-						user = get_object_or_404(
-							User, username = kwargs.pop('username')
-						)
-					elif request.user.is_authenticated():
-						user = request.user
-						edit = True
-					else:
-						return HttpResponseRedirect(
-							reverse('start_plan', args = [slug])
-						)
-					
-					plan = goal.plans.filter(
-						live = True, user = user
-					).latest()
-					
-					# Prepare to redirect if the user viewing the plan is
-					# the user who created it
-					
-					if not detail:
-						redirect = request.user.is_authenticated() and not edit
-					else:
-						redirect = False
-					
-					if redirect and plan.user == request.user:
-						return HttpResponseRedirect(
-							reverse('plan_logbook', args = [plan.goal.slug])
-						)
-					
-					return func(request, goal, plan, *args, **kwargs)
-				except Plan.DoesNotExist:
-					try:
-						if edit:
-							return HttpResponseRedirect(
-								reverse('start_plan', args = [goal.slug])
-							)
-					except UnboundLocalError:
-						pass
-					
-					return render_to_response(
-						'plan/not-attempting.html',
-						{
-							'user': user,
-							'live_plans': user.plans.filter(live = True)
-						},
-						RequestContext(request)
-					)
-			except Goal.DoesNotExist:
+			if len(args) >= 1:
+				slug = args.pop(0)
+			else:
+				slug = kwargs.pop('goal')
+			
+			if len(args) > 1 and not args[1] is None:
+				username = args.pop(1)
+			elif 'username' in kwargs:
+				username = kwargs.pop('username')
+			else:
+				username = None
+				edit = edit or request.user.is_authenticated()
+			
+			if username is None and not request.user.is_authenticated():
+				plan = None
+			else:
+				plan = get_plan(request, slug, username)
+			
+			if plan is None:
+				return plan_not_found(request, slug, username, edit)
+			
+			# Prepare to redirect if the user viewing the plan is the user who
+			# created it
+			
+			if not detail:
+				redirect = request.user.is_authenticated() and not edit
+			else:
+				redirect = False
+			
+			if redirect and plan.user == request.user:
 				return HttpResponseRedirect(
-					'%s?name=%s' % (
-						reverse('new_goal'),
-						slug.replace('-', ' ')
-					)
+					reverse('plan_logbook', args = [plan.goal.slug])
 				)
+			
+			return func(request, plan.goal, plan, *args, **kwargs)
 		return inner_decorator
 	return decorator
\ No newline at end of file
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.template import Context
+from django.template.loader import get_template
+from django.db.models import Sum
+from transphorm.goals.models import Plan, Reward, Milestone
+from datetime import datetime
+
+TEMPLATES = {
+	'ar': 'plan/email/action-log-reminder.txt',
+	'mr': 'plan/email/milestone-reminder.txt',
+	'mh': 'plan/email/milestone-hit.txt',
+	'mm': 'plan/email/milestone-miss.txt'
+}
+
+BASE_TEMPLATE = 'plan/email/base.html'
+
+class EmailRenderer(object):
+	"""
+	Renders UserEmail objects. The reminder templates and the HTML wrapper
+	are loaded and compiled once, when the renderer is created, so a single
+	renderer should be used for a whole batch of emails.
+	
+	The next milestone and unclaimed rewards for each plan can be fetched
+	up-front for a batch of plans with prefetch(), just before that batch is
+	rendered. Plans that aren't in the last batch prefetched have that data
+	queried when their email is rendered.
+	"""
+	
+	def __init__(self, site):
+		self.site = site
+		self.templates = dict(
+			[(kind, get_template(name)) for (kind, name) in TEMPLATES.items()]
+		)
+		
+		self.base_template = get_template(BASE_TEMPLATE)
+		self.prefetched = set()
+		self.next_milestones = {}
+		self.unclaimed_rewards = {}
+	
+	def prefetch(self, plans, now = None, chunk_size = 500):
+		"""
+		Fetch the next milestone and unclaimed rewards for each of the given
+		plans, with three queries for each chunk of plans. Anything fetched
+		by an earlier call is dropped, so memory stays in proportion to one
+		batch of plans rather than everything the renderer has seen.
+		"""
+		
+		now = now or datetime.now()
+		plans = list(plans)
+		
+		self.prefetched = set()
+		self.next_milestones = {}
+		self.unclaimed_rewards = {}
+		
+		for i in range(0, len(plans), chunk_size):
+			self._prefetch(plans[i:i + chunk_size], now)
+	
+	def _prefetch(self, plans, now):
+		ids = [plan.pk for plan in plans]
+		users = dict([(plan.pk, plan.user_id) for plan in plans])
+		
+		milestones = Milestone.objects.filter(
+			plan__in = ids,
+			deadline__gt = now,
+			reached__isnull = True
+		).order_by('plan', 'deadline')
+		
+		for milestone in milestones:
+			self.next_milestones.setdefault(milestone.plan_id, milestone)
+		
+		# Rewards can be claimed with the points from any of the user's live
+		# plans, so add up the unclaimed points per user
+		unclaimed_points = dict(
+			Plan.objects.filter(
+				live = True, user__in = list(set(users.values()))
+			).order_by().values('user').annotate(
+				unclaimed_points = Sum('points_unclaimed')
+			).values_list('user', 'unclaimed_points')
+		)
+		
+		rewards = Reward.objects.filter(
+			plan__in = ids,
+			plan__live = True
+		)
+		
+		for reward in rewards:
+			if reward.points <= (
+				unclaimed_points.get(users[reward.plan_id]) or 0
+			):
+				self.unclaimed_rewards.setdefault(
+					reward.plan_id, []
+				).append(reward)
+		
+		self.prefetched.update(ids)
+	
+	def get_next_milestone(self, plan):
+		if plan.pk in self.prefetched:
+			return self.next_milestones.get(plan.pk)
+		
+		milestones = plan.milestones.filter(
+			deadline__gt = datetime.now(),
+			reached__isnull = True
+		)[:1]
+		
+		if milestones.count() > 0:
+			return milestones[0]
+		
+		return None
+	
+	def get_unclaimed_rewards(self, plan):
+		if plan.pk in self.prefetched:
+			return self.unclaimed_rewards.get(plan.pk)
+		
+		unclaimed_rewards = plan.rewards.unclaimed(plan.user)
+		if unclaimed_rewards.count() > 0:
+			return unclaimed_rewards
+		
+		return None
+	
+	def render(self, email, **kwargs):
+		"""
+		Render the plain text and HTML versions of the given email
+		"""
+		
+		plan = email.plan
+		context = {
+			'plan': plan,
+			'user': plan.user,
+			'site': self.site,
+			'unclaimed_rewards': self.get_unclaimed_rewards(plan),
+			'next_milestone': self.get_next_milestone(plan)
+		}
+		
+		context.update(kwargs)
+		
+		email.body = self.templates[email.kind].render(
+			Context(context)
+		)
+		
+		email.html = self.base_template.render(
+			Context(
+				{
+					'body': email.body,
+					'site': self.site
+				}
+			)
+		)
@@ -143,20 +143,38 @@ class ProfileForm(forms.ModelForm):
 			'website',
 		)
 
+# The number of goals to list in the start form
+POPULAR_GOALS = 25
+
+def popular_goal_choices():
+	return [
+		(goal.pk, unicode(goal))
+		for goal in Goal.objects.most_popular()[:POPULAR_GOALS]
+	]
+
 class StartForm(forms.Form):
+	# Only the most popular goals are listed. The rest can be found through
+	# the goal search, and are checked one at a time when the form is sent
 	plan_copy = forms.ModelChoiceField(
-		queryset = Goal.objects.most_popular(),
+		queryset = Goal.objects.filter(live = True, plan_count__gt = 0),
 		required = False,
 		empty_label = None
 	)
 	
 	def __init__(self, *args, **kwargs):
+		from django.core.urlresolvers import reverse
+		from transphorm.goals.caching import cached
 		super(StartForm, self).__init__(*args, **kwargs)
 		
-		choices = [(x, y) for (x, y) in self.fields['plan_copy'].choices]
+		# The list of goals is shown on most pages, so it's shared through
+		# the cache and refreshed when plans or goals change
+		choices = list(cached('popular_goals', popular_goal_choices))
 		choices.append(('', '(create a new goal)'))
 		
 		self.fields['plan_copy'].widget.choices = choices
+		self.fields['plan_copy'].widget.attrs['data-search-url'] = reverse(
+			'goal_search'
+		)
 		self.fields['plan_copy'].initial = choices[0][0]
 	
 	plan_name = forms.CharField(max_length = 50, required = False)
@@ -203,6 +221,9 @@ class PlanForm(forms.ModelForm):
 	def save(self, commit = True):
 		plan = super(PlanForm, self).save(commit = False)
 		
+		if plan.pk and 'email_frequency' in self.changed_data:
+			plan.reschedule(commit = False)
+		
 		if not plan.pk:
 			plan.save()
 			original_plan = plan.goal.original_plan()
@@ -671,4 +692,55 @@ class ActionEntryForm(LogEntryForm):
 			'action',
 			'value',
 			'date'
-		)
\ No newline at end of file
+		)
+
+class BaseActionEntryFormSet(BaseModelFormSet):
+	# The most entries that can be logged in one go
+	max_entries = 31
+	
+	def __init__(self, *args, **kwargs):
+		self.plan = kwargs.pop('plan', None)
+		kwargs['queryset'] = ActionEntry.objects.none()
+		super(BaseActionEntryFormSet, self).__init__(*args, **kwargs)
+	
+	def _construct_form(self, i, **kwargs):
+		# The form needs the plan up-front, to narrow down the actions
+		kwargs['instance'] = ActionEntry(plan = self.plan)
+		return super(BaseActionEntryFormSet, self)._construct_form(i, **kwargs)
+	
+	def initial_form_count(self):
+		# Entries are only ever created here, so don't trust INITIAL_FORMS
+		# to point at existing ones
+		return 0
+	
+	def total_form_count(self):
+		# The forms are built in __init__, so cap the number the management
+		# form asks for here, before any of them are built
+		count = super(BaseActionEntryFormSet, self).total_form_count()
+		
+		if count > self.max_entries:
+			self.too_many = True
+			return self.max_entries
+		
+		return count
+	
+	def clean(self):
+		if getattr(self, 'too_many', False):
+			raise forms.ValidationError(
+				'You can only log %d entries at once.' % self.max_entries
+			)
+	
+	def entries(self):
+		"""
+		Return unsaved entries for each of the forms that was filled in
+		"""
+		
+		return [
+			form.save(commit = False)
+			for form in self.forms if form.has_changed()
+		]
+
+ActionEntryFormSet = modelformset_factory(
+	ActionEntry, form = ActionEntryForm, formset = BaseActionEntryFormSet,
+	extra = 0
+)
\ No newline at end of file
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.conf import settings
+from django.db import connection, transaction, DatabaseError
+from transphorm.goals.models import LogEntry
+import re
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+class SearchBackend(object):
+	"""
+	Keeps a full-text index of log entry bodies, and narrows down querysets
+	of log entries to those matching a search. Backends only match text;
+	which entries can be seen is left to the queryset they're given.
+	"""
+	
+	def setup(self):
+		"""
+		Create whatever the backend needs to store its index
+		"""
+		
+		pass
+	
+	def index(self, entry):
+		pass
+	
+	def remove(self, pk):
+		pass
+	
+	def filter(self, entries, query):
+		raise NotImplementedError('Backends must implement filter()')
+
+class SimpleBackend(SearchBackend):
+	"""
+	Matches each word of the search against the entry body, without an
+	index. Fine for small databases, or ones with no full-text support.
+	"""
+	
+	def filter(self, entries, query):
+		for word in WORD_RE.findall(query):
+			entries = entries.filter(body__icontains = word)
+		
+		return entries
+
+class SQLiteBackend(SearchBackend):
+	"""
+	Indexes log entries in an SQLite FTS5 table, using the entry IDs as row
+	IDs. Each word of a search matches the start of a word in the entry.
+	
+	syncdb creates the table, and databases made before the index existed
+	get it the first time it's needed, without a migration. If SQLite was
+	built without FTS5, entries aren't indexed and searches fall back to the
+	simple backend.
+	"""
+	
+	table = 'goals_logentry_fts'
+	
+	# None until the table has been checked for, then whether it can be used
+	available = None
+	
+	def execute(self, sql, params = None):
+		cursor = connection.cursor()
+		cursor.execute(sql % {'table': self.table}, params or [])
+		transaction.commit_unless_managed()
+	
+	def setup(self):
+		try:
+			self.execute(
+				'CREATE VIRTUAL TABLE IF NOT EXISTS %(table)s USING fts5(body)'
+			)
+		except DatabaseError:
+			SQLiteBackend.available = False
+		else:
+			SQLiteBackend.available = True
+		
+		return SQLiteBackend.available
+	
+	def ready(self):
+		if SQLiteBackend.available is None:
+			# Look for the table before creating it, as SQLite commits any
+			# open transaction before running a CREATE
+			cursor = connection.cursor()
+			cursor.execute(
+				'SELECT 1 FROM sqlite_master WHERE type = %s AND name = %s',
+				['table', self.table]
+			)
+			
+			if cursor.fetchone() is None:
+				return self.setup()
+			
+			SQLiteBackend.available = True
+		
+		return SQLiteBackend.available
+	
+	def index(self, entry):
+		if not self.ready():
+			return
+		
+		self.remove(entry.pk)
+		self.execute(
+			'INSERT INTO %(table)s (rowid, body) VALUES (%%s, %%s)',
+			[entry.pk, entry.body]
+		)
+	
+	def remove(self, pk):
+		if not self.ready():
+			return
+		
+		self.execute('DELETE FROM %(table)s WHERE rowid = %%s', [pk])
+	
+	def match(self, query):
+		return u' '.join(
+			[u'"%s"*' % word for word in WORD_RE.findall(query)]
+		)
+	
+	def filter(self, entries, query):
+		if not self.ready():
+			return SimpleBackend().filter(entries, query)
+		
+		match = self.match(query)
+		if not match:
+			return entries.none()
+		
+		return entries.extra(
+			where = [
+				'%s.id IN (SELECT rowid FROM %s WHERE %s MATCH %%s)' % (
+					connection.ops.quote_name(LogEntry._meta.db_table),
+					self.table, self.table
+				)
+			],
+			params = [match]
+		)
+
+def get_backend():
+	"""
+	Return the search backend named by the LOGENTRY_SEARCH_BACKEND setting.
+	By default SQLite databases get an FTS index, and others fall back to
+	the simple backend.
+	"""
+	
+	from django.utils.importlib import import_module
+	
+	path = getattr(settings, 'LOGENTRY_SEARCH_BACKEND', None)
+	if path is None:
+		if 'sqlite' in settings.DATABASES['default']['ENGINE']:
+			return SQLiteBackend()
+		
+		return SimpleBackend()
+	
+	module, name = path.rsplit('.', 1)
+	return getattr(import_module(module), name)()
+
+def search_entries(entries, query):
+	return get_backend().filter(entries, query)
@@ -11,6 +11,13 @@ GREETINGS = (
 	'Looking good, <span>%s</span>!'
 )
 
+CRON_LOG_MESSAGES = {
+	'ar': 'Queued message for user %s: %s',
+	'mr': 'Queued milestone reminder for user %s: %s',
+	'mh': 'Queued milestone notification for user %s: %s',
+	'mm': 'Queued milestone notification for user %s: %s'
+}
+
 def get_greeting(request):
 	"""
 	Returns a random greeting to the user for their Plan page. The greeting
@@ -43,18 +50,75 @@ def get_goal_or_404(slug):
 
 def paginated(entries, request):
 	"""
-	Return a paginated list of log entries
+	Return a page of log entries, using the "before" or "after" cursor from
+	the query string
 	"""
 	
-	from django.core.paginator import Paginator
+	from transphorm.goals.paging import KeysetPage, parse_cursor
 	entries_per_page = 20
-	paginator = Paginator(entries, entries_per_page)
 	
 	try:
 		page = int(request.GET.get('page', 1))
 	except ValueError:
 		page = 1
-	return paginator.page(page)
+	
+	return KeysetPage(
+		entries, entries_per_page,
+		before = parse_cursor(request.GET.get('before')),
+		after = parse_cursor(request.GET.get('after')),
+		page = page
+	)
+
+def prefetch_entries(entries, plan = None, request = None):
+	"""
+	Load everything the plan/entry.inc.html template needs for a list of log
+	entries, and return them as a list. If all the entries belong to the same
+	plan, pass it in so it's shared between them. Otherwise the entries
+	should be selected along with their plans' users and goals.
+	
+	Each user's profile is fetched in one query and set as user.profile. If
+	the request is given, the entries' cached renderings are looked up for
+	it in one go too.
+	"""
+	
+	from transphorm.goals.models import Profile
+	entries = list(entries)
+	
+	if plan is None:
+		users = [entry.plan.user for entry in entries]
+	else:
+		for entry in entries:
+			entry.plan = plan
+		
+		users = [plan.user]
+	
+	# Profiles already fetched by plan_view don't need fetching again
+	profiles = dict(
+		[
+			(user.pk, user._profile_cache) for user in users
+			if hasattr(user, '_profile_cache')
+		]
+	)
+	
+	missing = list(set([user.pk for user in users if not user.pk in profiles]))
+	if len(missing) > 0:
+		profiles.update(
+			dict(
+				[
+					(profile.user_id, profile)
+					for profile in Profile.objects.filter(user__in = missing)
+				]
+			)
+		)
+	
+	for user in users:
+		user.profile = profiles.get(user.pk)
+	
+	if not request is None:
+		from transphorm.goals.templatetags.entrycache import prefetch_fragments
+		prefetch_fragments(request, entries)
+	
+	return entries
 
 def serialise_actions(plan):
 	"""
@@ -79,6 +143,48 @@ def serialise_measurements():
 	
 	return dumps(measurements)
 	
+def log_actions(plan, entries):
+	"""
+	Save a batch of action entries against a plan. The entries are saved in
+	a single transaction, and the plan's points, daily totals and chart
+	cache are updated once for the whole batch rather than once per entry.
+	"""
+	
+	from django.db import transaction
+	from transphorm.goals.models import PlanDailyPoints
+	from transphorm.goals.management import entry_day
+	from transphorm.goals.caching import bump_version
+	
+	@transaction.commit_on_success
+	def save_entries():
+		points = 0
+		totals = {}
+		
+		for entry in entries:
+			# Tells the post_save handler to leave the totals to us
+			entry.plan = plan
+			entry.batched = True
+			entry.save()
+			
+			value = entry.points_value()
+			key = (entry_day(entry), entry.action_id)
+			day_points, day_entries = totals.get(key, (0, 0))
+			totals[key] = (day_points + value, day_entries + 1)
+			points += value
+		
+		plan.add_points(points, points)
+		for ((day, action_id), (day_points, day_entries)) in sorted(totals.items()):
+			PlanDailyPoints.objects.record(
+				plan.pk, day, action_id, day_points, day_entries
+			)
+		
+		return points
+	
+	points = save_entries()
+	bump_version('plan_data_%s' % plan.pk)
+	
+	return points
+
 def cron(fake_date = None):
 	"""
 	A cron job which should run at, say 5pm every day, and give people
@@ -91,106 +197,145 @@ def cron(fake_date = None):
 	again, unless necessary.
 	"""
 	
-	from datetime import datetime, timedelta
-	from django.core.mail import get_connection
+	from datetime import datetime
 	from django.contrib.sites.models import Site
+	from transphorm.goals.emails import EmailRenderer
+	from transphorm.goals.planner import CronPlanner
 	
-	plans = Plan.objects.filter(live = True).exclude(email_frequency = 0)
-	messages = []
 	log = []
 	now = fake_date or datetime.now()
 	
-	site = Site.objects.get_current()
-	for plan in plans:
-		can_email = False
-		
-		try:
-			latest_email = plan.emails.latest()
-			next_email_date = latest_email.date + timedelta(
-				days = plan.email_frequency
-			)
-			
-			# If the next email date is in the past, we need to email this
-			# user an action reminder
-			if next_email_date <= now:
-				can_email = True
-		except:
-			can_email = True
+	renderer = EmailRenderer(Site.objects.get_current())
+	planner = CronPlanner(now)
+	emails = planner.plan()
+	
+	log.append(
+		'Planned %d emails using %d queries' % (
+			len(emails), planner.queries
+		)
+	)
+	
+	renderer.prefetch(
+		dict([(plan.pk, plan) for (plan, kind, milestone) in emails]).values()
+	)
+	
+	for plan, kind, milestone in emails:
+		log.append(
+			queue_email(plan, kind, milestone, now, renderer)
+		)
+	
+	return log
+
+def queue_email(plan, kind, milestone, now, renderer):
+	"""
+	Render and queue an email planned by the cron job, and return a line for
+	the cron log. Emails are sent by the dispatch_emails management command,
+	which retries any that fail.
+	"""
+	
+	from transphorm.goals.models import UserEmail
+	
+	if kind == 'mh':
+		milestone.reached = now
+		milestone.save()
+	
+	email = UserEmail(plan = plan, kind = kind)
+	if milestone is None:
+		email.render(renderer.site, renderer)
+	else:
+		email.render(renderer.site, renderer, milestone = milestone)
+	
+	email.save()
+	return CRON_LOG_MESSAGES[kind] % (
+		plan.user.username, email.subject
+	)
+
+def cron_shard(shard, shards, fake_date = None, batch_size = 500):
+	"""
+	Run the cron job for one shard of the live plans, split by plan ID. This
+	is a generator which yields lines for the log as it goes.
+	
+	Progress is checkpointed after each plan, in the same transaction as the
+	emails queued for it, so if the shard is killed part-way through it picks
+	up from the next plan when it's run again, without emailing anyone twice.
+	"""
+	
+	from datetime import datetime
+	from django.db import transaction
+	from django.contrib.sites.models import Site
+	from transphorm.goals.models import CronCheckpoint
+	from transphorm.goals.emails import EmailRenderer
+	from transphorm.goals.planner import CronPlanner, due_plans
+	
+	now = fake_date or datetime.now()
+	renderer = EmailRenderer(Site.objects.get_current())
+	
+	checkpoint, created = CronCheckpoint.objects.get_or_create(
+		day = now.date(), shard = shard, shards = shards
+	)
+	
+	if checkpoint.finished:
+		yield 'Already finished %s' % checkpoint
+		return
+	
+	if checkpoint.last_plan:
+		yield 'Resuming %s after plan %d' % (checkpoint, checkpoint.last_plan)
+	
+	@transaction.commit_on_success
+	def queue_plan_emails(plan, emails):
+		lines = [
+			queue_email(plan, kind, milestone, now, renderer)
+			for (plan, kind, milestone) in emails
+		]
 		
-		if can_email:
-			email = plan.emails.create(kind = 'ar')
-			messages.append(
-				email.prepare_message(site)
-			)
-			
-			log.append(
-				'Prepared message for user %s: %s' % (
-					plan.user.username, email.subject
-				)
-			)
+		checkpoint.last_plan = plan.pk
+		checkpoint.save()
+		return lines
+	
+	plans = due_plans(
+		Plan.objects.filter(live = True).exclude(
+			email_frequency = 0
+		).extra(
+			where = ['%s.id %%%% %%s = %%s' % Plan._meta.db_table],
+			params = [shards, shard]
+		),
+		now
+	).order_by('pk')
+	
+	while True:
+		ids = list(
+			plans.filter(
+				pk__gt = checkpoint.last_plan
+			).values_list('pk', flat = True)[:batch_size]
+		)
 		
-		can_email = False
+		if len(ids) == 0:
+			break
 		
-		try:
-			latest_email = plan.emails.filter(kind = 'mr').latest()
-			next_email_date = latest_email.date + timedelta(days = 5)
-			
-			# If 5 days have passed since the last email, we can prepare to
-			# send milestone reminders
-			if next_email_date <= now:
-				can_email = True
-		except:
-			# No milestone reminders have been sent before. All clear
-			can_email = True
+		planner = CronPlanner(
+			now, Plan.objects.filter(pk__in = ids).order_by('pk')
+		)
 		
-		if can_email:
-			upcoming_milestones = plan.milestones.filter(
-				deadline__range = (
-					now, now + timedelta(days = 3)
-				),
-				reached__isnull = True,
-				send_emails = True
-			)
+		planned = {}
+		for (plan, kind, milestone) in planner.plan():
+			planned.setdefault(plan.pk, []).append((plan, kind, milestone))
 		
-			for milestone in upcoming_milestones:
-				email = plan.emails.create(kind = 'mr')
-				messages.append(
-					email.prepare_message(site, milestone = milestone)
-				)
-				
-				log.append(
-					'Prepared milestone reminder for user %s: %s' % (
-						plan.user.username, email.subject
-					)
-				)
+		renderer.prefetch(
+			[emails[0][0] for emails in planned.values()]
+		)
 		
-		milestones_today = plan.milestones.filter(
-			deadline__year = now.year,
-			deadline__month = now.month,
-			deadline__day = now.day,
-			reached__isnull = True,
-			send_emails = True
+		yield 'Planned %d plans using %d queries' % (
+			len(ids), planner.queries
 		)
 		
-		for milestone in milestones_today:
-			if milestone.points_remaining() > 0:
-				email = plan.emails.create(kind = 'mm')
-			else:
-				milestone.reached = now
-				milestone.save()
-				email = plan.emails.create(kind = 'mh')
-			
-			messages.append(
-				email.prepare_message(site, milestone = milestone)
-			)
-			
-			log.append(
-				'Prepared milestone notification for user %s: %s' % (
-					plan.user.username, email.subject
-				)
-			)
-	
-	connection = get_connection()
-	connection.send_messages(messages)
+		for pk in sorted(planned.keys()):
+			emails = planned[pk]
+			for line in queue_plan_emails(emails[0][0], emails):
+				yield line
+		
+		checkpoint.last_plan = ids[-1]
+		checkpoint.save()
 	
-	return log
\ No newline at end of file
+	checkpoint.finished = True
+	checkpoint.save()
+	yield 'Finished %s' % checkpoint
\ No newline at end of file
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.db import transaction, reset_queries
+from transphorm.goals.models import ActionEntry, PlanDailyPoints
+from transphorm.goals.points import repair
+from transphorm.goals.caching import bump_version
+from datetime import datetime
+import csv
+
+DATE_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d')
+FIELDS = ('action', 'value', 'date')
+
+# Only the first few errors are kept, so a badly-formed file doesn't use up
+# memory
+MAX_ERRORS = 100
+
+class RowError(Exception):
+	pass
+
+def read_csv(f):
+	"""
+	Yield the line number and a dictionary for each row of a CSV file. The
+	first row should name the action, value and date columns.
+	"""
+	
+	reader = csv.DictReader(f)
+	for row in reader:
+		# line_num counts the header, and any line breaks within fields
+		yield reader.line_num, dict(
+			[(k, (v or '').decode('utf-8')) for (k, v) in row.items() if k]
+		)
+
+def read_json(f):
+	"""
+	Yield the line number and decoded value for each line of a file with one
+	JSON object per line. Lines that aren't valid JSON come back as None.
+	"""
+	
+	from django.utils.simplejson import loads
+	
+	for number, line in enumerate(f):
+		line = line.strip()
+		if line:
+			try:
+				yield number + 1, loads(line)
+			except ValueError:
+				yield number + 1, None
+
+READERS = {
+	'csv': read_csv,
+	'json': read_json
+}
+
+class ActionImporter(object):
+	"""
+	Imports historical action entries into a plan from a stream of rows. Each
+	row names one of the plan's actions (or gives its ID) along with an
+	optional value and the date it was done.
+	
+	Rows are read one at a time and saved in chunks, each in its own
+	transaction, so the whole file never needs to be held in memory. The
+	plan's point totals, daily totals and chart cache are brought up to date
+	once, at the end.
+	"""
+	
+	def __init__(self, plan, chunk_size = 500):
+		self.plan = plan
+		self.chunk_size = chunk_size
+		self.actions = {}
+		self.imported = 0
+		self.failed = 0
+		self.errors = []
+		
+		for action in plan.actions.all():
+			self.actions[unicode(action.pk)] = action
+			self.actions[action.name.lower()] = action
+	
+	def parse(self, row):
+		"""
+		Return an unsaved ActionEntry for a row, or raise a RowError
+		"""
+		
+		if not isinstance(row, dict):
+			raise RowError('Not a JSON object')
+		
+		name = unicode(row.get('action') or '').strip()
+		action = self.actions.get(name.lower())
+		if action is None:
+			raise RowError('Unknown action "%s"' % name)
+		
+		value = row.get('value')
+		if value in (None, ''):
+			value = None
+		else:
+			try:
+				value = int(value)
+			except (ValueError, TypeError):
+				raise RowError('Invalid value "%s"' % value)
+			
+			if value < 0:
+				raise RowError('Invalid value "%s"' % value)
+		
+		date = unicode(row.get('date') or '').strip()
+		for date_format in DATE_FORMATS:
+			try:
+				date = datetime.strptime(date, date_format)
+				break
+			except ValueError:
+				continue
+		else:
+			raise RowError('Invalid date "%s"' % date)
+		
+		if date > datetime.now():
+			raise RowError('Date %s is in the future' % date)
+		
+		return ActionEntry(
+			plan = self.plan,
+			action = action,
+			value = value,
+			date = date
+		)
+	
+	def error(self, line, message):
+		self.failed += 1
+		if len(self.errors) < MAX_ERRORS:
+			self.errors.append((line, message))
+	
+	def save_chunk(self, entries):
+		@transaction.commit_on_success
+		def save():
+			for entry in entries:
+				# Leave the totals until the end
+				entry.batched = True
+				entry.save()
+		
+		save()
+		self.imported += len(entries)
+		
+		# Stop the debug query log from growing with every chunk
+		reset_queries()
+	
+	def finish(self):
+		@transaction.commit_on_success
+		def rebuild():
+			repair([self.plan.pk])
+			PlanDailyPoints.objects.rebuild(self.plan)
+		
+		rebuild()
+		bump_version('plan_data_%s' % self.plan.pk)
+	
+	def run(self, rows):
+		"""
+		Import the given (line number, row) pairs, yielding the number of
+		entries imported after each chunk
+		"""
+		
+		chunk = []
+		
+		# Chunks already saved are committed, so the totals need repairing
+		# even if a later chunk fails or the caller stops early
+		try:
+			for line, row in rows:
+				try:
+					chunk.append(self.parse(row))
+				except RowError, ex:
+					self.error(line, unicode(ex))
+					continue
+				
+				if len(chunk) >= self.chunk_size:
+					self.save_chunk(chunk)
+					chunk = []
+					yield self.imported
+			
+			if len(chunk) > 0:
+				self.save_chunk(chunk)
+				yield self.imported
+		finally:
+			self.finish()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.db.models.signals import post_save, pre_save, post_delete
+from django.db.models import F
+from django.contrib.auth.models import User
+from transphorm.goals.models import Goal, Plan, LogEntry, ActionEntry, \
+	Action, RewardClaim, MilestoneHit, Comment, PlanDailyPoints, Profile
+from transphorm.goals.signals import comment_classified
+from transphorm.goals.caching import bump_version
+
+def entry_day(instance):
+	return day_of(instance.date)
+
+def day_of(date):
+	from datetime import datetime
+	
+	if isinstance(date, datetime):
+		return date.date()
+	
+	return date
+
+def action_post_save(sender, **kwargs):
+	instance = kwargs.get('instance')
+	date, action_id, value = instance._original
+	instance._original = (instance.date, instance.action_id, instance.value)
+	
+	# Entries saved in a batch have their totals updated all at once, by
+	# helpers.log_actions
+	if getattr(instance, 'batched', False):
+		return
+	
+	if kwargs.get('created', False) == True:
+		instance.plan.add_points(
+			instance.points_value(), instance.points_value()
+		)
+		
+		PlanDailyPoints.objects.record(
+			instance.plan_id, entry_day(instance), instance.action_id,
+			instance.points_value()
+		)
+	elif (day_of(date), action_id, value) != (
+		entry_day(instance), instance.action_id, instance.value
+	):
+		# The entry has been edited, so take its old points off the day and
+		# action it was logged against, and add the new ones
+		if action_id == instance.action_id:
+			action = instance.action
+		else:
+			action = Action.objects.get(pk = action_id)
+		
+		old_points = ActionEntry.calculate_points(
+			action.kind, value, action.points
+		)
+		
+		instance.plan.add_points(
+			instance.points_value() - old_points,
+			instance.points_value() - old_points
+		)
+		
+		PlanDailyPoints.objects.record(
+			instance.plan_id, day_of(date), action_id, -old_points, -1
+		)
+		
+		PlanDailyPoints.objects.record(
+			instance.plan_id, entry_day(instance), instance.action_id,
+			instance.points_value()
+		)
+	
+	bump_version('plan_data_%s' % instance.plan_id)
+post_save.connect(action_post_save, sender = ActionEntry)
+
+def action_post_delete(sender, **kwargs):
+	instance = kwargs.get('instance')
+	
+	instance.plan.add_points(
+		-instance.points_value(), -instance.points_value()
+	)
+	
+	PlanDailyPoints.objects.record(
+		instance.plan_id, entry_day(instance), instance.action_id,
+		-instance.points_value(), -1
+	)
+	
+	bump_version('plan_data_%s' % instance.plan_id)
+post_delete.connect(action_post_delete, sender = ActionEntry)
+
+def comment_post_classify(sender, **kwargs):
+	instance = kwargs.get('instance')
+	
+	if not instance.is_spam:
+		from django.core.mail import send_mail
+		from django.conf import settings
+		from django.template.loader import render_to_string
+		from django.contrib.sites.models import Site
+		
+		print 'Emailing ' + instance.plan.user.email
+		send_mail(
+			'Someone has commented on your progress',
+			render_to_string(
+				'plan/email/comment.txt',
+				{
+					'plan': instance.plan,
+					'user': instance.plan.user,
+					'site': Site.objects.get_current(),
+					'comment': instance
+				}
+			),
+			getattr(settings, 'DEFAULT_FROM_EMAIL'),
+			(instance.plan.user.email,),
+		)
+comment_classified.connect(comment_post_classify, sender = Comment)
+
+def claim_post_save(sender, **kwargs):
+	instance = kwargs.get('instance')
+	
+	if kwargs.get('created', False) == True:
+		instance.plan.add_points(unclaimed = -instance.points_value())
+
+def claim_post_delete(sender, **kwargs):
+	instance = kwargs.get('instance')
+	
+	instance.plan.add_points(unclaimed = instance.points_value())
+
+post_save.connect(claim_post_save, sender = RewardClaim)
+post_delete.connect(claim_post_delete, sender = RewardClaim)
+
+def entry_post_change(sender, **kwargs):
+	instance = kwargs.get('instance')
+	
+	# Drop any cached renderings of the entry, unless it's brand new
+	if not kwargs.get('created', False):
+		bump_version('entry_%s' % instance.pk)
+	
+	bump_version('latest_log_entries')
+	
+	from transphorm.goals.fulltext import get_backend
+	if kwargs.get('signal') == post_delete:
+		get_backend().remove(instance.pk)
+	else:
+		get_backend().index(instance)
+
+def profile_post_save(sender, **kwargs):
+	instance = kwargs.get('instance')
+	
+	if sender == User:
+		bump_version('profile_%s' % instance.pk)
+		return
+	
+	bump_version('profile_%s' % instance.user_id)
+	
+	# The latest plans and entries only include public profiles. Users are
+	# saved every time they log in, so they're left to time out instead
+	bump_version('latest_plans')
+	bump_version('latest_log_entries')
+
+def plan_post_change(sender, **kwargs):
+	bump_version('latest_plans')
+	bump_version('popular_goals')
+
+def plan_post_delete(sender, **kwargs):
+	instance = kwargs.get('instance')
+	
+	if instance.live:
+		Goal.objects.filter(pk = instance.goal_id).update(
+			plan_count = F('plan_count') - 1
+		)
+
+def goal_post_change(sender, **kwargs):
+	bump_version('popular_goals')
+
+def goal_post_save(sender, **kwargs):
+	from transphorm.goals.search import index_goal
+	index_goal(kwargs.get('instance'))
+
+for model in (LogEntry, ActionEntry, RewardClaim, MilestoneHit, Comment):
+	post_save.connect(entry_post_change, sender = model)
+	post_delete.connect(entry_post_change, sender = model)
+
+post_save.connect(profile_post_save, sender = Profile)
+post_save.connect(profile_post_save, sender = User)
+
+post_save.connect(plan_post_change, sender = Plan)
+post_delete.connect(plan_post_change, sender = Plan)
+post_delete.connect(plan_post_delete, sender = Plan)
+post_save.connect(goal_post_change, sender = Goal)
+post_save.connect(goal_post_save, sender = Goal)
+post_delete.connect(goal_post_change, sender = Goal)
\ No newline at end of file
@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.core.management.base import BaseCommand, CommandError
+
+class Command(BaseCommand):
+	help = 'Runs a local server that stands in for the Akismet API.'
+	args = '[port]'
+	
+	def handle(self, *args, **options):
+		from transphorm.goals.spam import stub_server
+		
+		try:
+			port = int(args and args[0] or 8001)
+		except ValueError:
+			raise CommandError('%s is not a valid port number.' % args[0])
+		
+		server = stub_server(port = port)
+		print 'Set AKISMET_URL to http://localhost:%d/1.1/' % port
+		
+		try:
+			server.serve_forever()
+		except KeyboardInterrupt:
+			pass
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.core.management.base import BaseCommand
+from optparse import make_option
+
+class Command(BaseCommand):
+	help = 'Compares the cost of rendering reminder emails one by one ' \
+		'against rendering them as a batch.'
+	
+	option_list = BaseCommand.option_list + (
+		make_option('--plans', type = 'int', dest = 'plans', default = 200,
+			help = 'Number of live plans to render action reminders for.'
+		),
+	)
+	
+	def handle(self, *args, **options):
+		from django.conf import settings
+		from django.db import connection
+		from django.contrib.sites.models import Site
+		from django.template.loader import render_to_string
+		from transphorm.goals.models import Plan, UserEmail
+		from transphorm.goals.emails import EmailRenderer, TEMPLATES, \
+			BASE_TEMPLATE
+		from datetime import datetime
+		import time
+		
+		# Log queries so they can be counted
+		settings.DEBUG = True
+		site = Site.objects.get_current()
+		plans = list(
+			Plan.objects.filter(live = True).select_related(
+				'user', 'goal'
+			)[:options.get('plans')]
+		)
+		
+		if len(plans) == 0:
+			print 'There are no live plans to render emails for.'
+			return
+		
+		def render_individually():
+			# How UserEmail.prepare_message used to render each email
+			for plan in plans:
+				milestones = plan.milestones.filter(
+					deadline__gt = datetime.now(),
+					reached__isnull = True
+				)[:1]
+				
+				if milestones.count() > 0:
+					next_milestone = milestones[0]
+				else:
+					next_milestone = None
+				
+				unclaimed_rewards = plan.rewards.unclaimed(plan.user)
+				if unclaimed_rewards.count() == 0:
+					unclaimed_rewards = None
+				
+				body = render_to_string(
+					TEMPLATES['ar'],
+					{
+						'plan': plan,
+						'user': plan.user,
+						'site': site,
+						'unclaimed_rewards': unclaimed_rewards,
+						'next_milestone': next_milestone
+					}
+				)
+				
+				render_to_string(
+					BASE_TEMPLATE,
+					{
+						'body': body,
+						'site': site
+					}
+				)
+		
+		def render_batch():
+			renderer = EmailRenderer(site)
+			renderer.prefetch(plans)
+			
+			for plan in plans:
+				renderer.render(UserEmail(plan = plan, kind = 'ar'))
+		
+		for name, func in (
+			('Individually', render_individually),
+			('As a batch', render_batch)
+		):
+			connection.queries = []
+			started = time.time()
+			func()
+			elapsed = time.time() - started
+			
+			print '%s: %.2fms and %.2f queries per email' % (
+				name,
+				elapsed * 1000.0 / len(plans),
+				len(connection.queries) / float(len(plans))
+			)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.core.management.base import BaseCommand
+from optparse import make_option
+
+class Command(BaseCommand):
+	help = 'Checks new comments for spam, in the background.'
+	option_list = BaseCommand.option_list + (
+		make_option('--batch-size', type = 'int', dest = 'batch_size',
+			help = 'Number of comments to check at a time.'
+		),
+		make_option('--interval', type = 'int', dest = 'interval',
+			default = 10,
+			help = 'Number of seconds to wait when there\'s nothing to do.'
+		),
+		make_option('--once', action = 'store_true', dest = 'once',
+			default = False,
+			help = 'Exit once there are no more comments to check.'
+		),
+	)
+	
+	def handle(self, *args, **options):
+		from transphorm.goals.spam import Classifier, prefilter_stats
+		import time
+		
+		classifier = Classifier(batch_size = options.get('batch_size'))
+		
+		while True:
+			classified, skipped = classifier.run()
+			
+			for comment in classified:
+				print 'Comment %d is %s' % (
+					comment.pk, comment.is_spam and 'SPAM' or 'NOT spam'
+				)
+			
+			if len(skipped) > 0:
+				print 'Left %d comments pending%s' % (
+					len(skipped),
+					classifier.breaker.is_open and \
+						' (Akismet is unavailable)' or ''
+				)
+			
+			if len(classified) > 0:
+				print 'Pre-filter hit ratio: %.1f%%' % (
+					prefilter_stats()['hit_ratio'] * 100
+				)
+			
+			if len(classified) == 0:
+				if options.get('once'):
+					break
+				
+				time.sleep(options.get('interval'))
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.core.management.base import BaseCommand
+from optparse import make_option
+
+class Command(BaseCommand):
+	help = 'Deletes rendered chart files that are no longer being served. ' \
+		'Run this from cron.'
+	option_list = BaseCommand.option_list + (
+		make_option('--max-age', type = 'int', dest = 'max_age',
+			help = 'Delete charts unused for this many seconds. ' \
+				'Defaults to the CHART_MAX_AGE setting, or a day longer ' \
+				'than charts are cached for.'
+		),
+	)
+	
+	def handle(self, *args, **options):
+		from django.conf import settings
+		from transphorm.goals.charts import clean_charts
+		from transphorm.goals.templatetags.goalcharts import \
+			STALE_CHART_TIMEOUT
+		
+		# A chart's <img> tag can stay cached for as long as the stale copy,
+		# so leave a day's grace on top of that
+		max_age = options.get('max_age') or getattr(
+			settings, 'CHART_MAX_AGE', STALE_CHART_TIMEOUT + 60 * 60 * 24
+		)
+		
+		print 'Deleted %d charts' % clean_charts(max_age)
\ No newline at end of file
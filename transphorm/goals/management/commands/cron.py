@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+import sys
+
+def run_shard(args):
+	"""
+	Run a single shard of the cron job in a worker process, streaming its
+	log to stdout
+	"""
+	
+	from django.db import connection
+	from transphorm.goals.helpers import cron_shard
+	
+	shard, shards, fake_date, batch_size = args
+	
+	# Don't share the parent process's database connection
+	connection.close()
+	
+	for line in cron_shard(shard, shards, fake_date, batch_size):
+		sys.stdout.write('[shard %d/%d] %s\n' % (shard + 1, shards, line))
+		sys.stdout.flush()
+	
+	connection.close()
+	return shard
+
+class Command(BaseCommand):
+	help = 'Queues reminder and milestone emails, split into shards by plan.'
+	option_list = BaseCommand.option_list + (
+		make_option('--shards', type = 'int', dest = 'shards', default = 4,
+			help = 'Number of shards to split the live plans into.'
+		),
+		make_option('--processes', type = 'int', dest = 'processes',
+			help = 'Number of worker processes (defaults to one per shard).'
+		),
+		make_option('--batch-size', type = 'int', dest = 'batch_size',
+			default = 500,
+			help = 'Number of plans to plan for at a time within a shard.'
+		),
+		make_option('--date', dest = 'date',
+			help = 'Run the job as if it were the given date (YYYY-MM-DD).'
+		),
+	)
+	
+	def handle(self, *args, **options):
+		from multiprocessing import Pool
+		from datetime import datetime
+		from django.db import connection
+		
+		shards = options.get('shards')
+		if shards < 1:
+			raise CommandError('There must be at least one shard.')
+		
+		if options.get('date'):
+			try:
+				fake_date = datetime(*
+					[int(i) for i in options.get('date').split('-')]
+				)
+			except (TypeError, ValueError):
+				raise CommandError('Dates should be given as YYYY-MM-DD.')
+		else:
+			fake_date = None
+		
+		connection.close()
+		pool = Pool(options.get('processes') or shards)
+		
+		try:
+			for shard in pool.imap_unordered(
+				run_shard, [
+					(shard, shards, fake_date, options.get('batch_size'))
+					for shard in range(shards)
+				]
+			):
+				print 'Finished shard %d of %d' % (shard + 1, shards)
+		finally:
+			pool.close()
+			pool.join()
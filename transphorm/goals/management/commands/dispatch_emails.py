@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.core.management.base import BaseCommand
+from optparse import make_option
+
+class Command(BaseCommand):
+	help = 'Sends queued emails, retrying any that fail.'
+	option_list = BaseCommand.option_list + (
+		make_option('--connections', type = 'int', dest = 'connections',
+			help = 'Maximum number of SMTP connections to open at once.'
+		),
+		make_option('--chunk-size', type = 'int', dest = 'chunk_size',
+			help = 'Number of emails to claim from the queue at a time.'
+		),
+		make_option('--interval', type = 'int', dest = 'interval',
+			default = 30,
+			help = 'Number of seconds to wait when the queue is empty.'
+		),
+		make_option('--once', action = 'store_true', dest = 'once',
+			default = False,
+			help = 'Exit once the queue has been drained.'
+		),
+	)
+	
+	def handle(self, *args, **options):
+		from transphorm.goals.outbox import Dispatcher
+		import time
+		
+		dispatcher = Dispatcher(
+			connections = options.get('connections'),
+			chunk_size = options.get('chunk_size')
+		)
+		
+		while True:
+			sent, failed = dispatcher.dispatch()
+			
+			for email in sent:
+				print 'Sent email %d to %s: %s' % (
+					email.pk, email.plan.user.email, email.subject
+				)
+			
+			for email in failed:
+				print 'Failed to send email %d (%s, attempt %d): %s' % (
+					email.pk, email.status, email.attempts, email.last_error
+				)
+			
+			if len(sent) + len(failed) == 0:
+				if options.get('once'):
+					break
+				
+				time.sleep(options.get('interval'))
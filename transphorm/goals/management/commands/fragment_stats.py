@@ -0,0 +1,15 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.core.management.base import NoArgsCommand
+
+class Command(NoArgsCommand):
+	help = 'Shows how often rendered log entries are served from the cache.'
+	
+	def handle_noargs(self, **options):
+		from transphorm.goals.templatetags.entrycache import fragment_stats
+		
+		stats = fragment_stats()
+		print 'Served from the cache: %d' % stats['hits']
+		print 'Rendered: %d' % stats['misses']
+		print 'Hit ratio: %.1f%%' % (stats['hit_ratio'] * 100)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+
+class Command(BaseCommand):
+	args = '<plan ID> <file>'
+	help = 'Imports historical action entries into a plan from a CSV file ' \
+		'(with action, value and date columns) or a file of JSON objects, ' \
+		'one per line.'
+	
+	option_list = BaseCommand.option_list + (
+		make_option('--format', dest = 'format', default = 'csv',
+			help = 'The format of the file: csv or json.'
+		),
+		make_option('--chunk-size', type = 'int', dest = 'chunk_size',
+			default = 500,
+			help = 'Number of entries to save at a time.'
+		),
+	)
+	
+	def handle(self, *args, **options):
+		from transphorm.goals.models import Plan
+		from transphorm.goals.importer import ActionImporter, READERS
+		
+		if len(args) != 2:
+			raise CommandError('Please specify a plan ID and a file.')
+		
+		try:
+			plan = Plan.objects.get(pk = args[0])
+		except (Plan.DoesNotExist, ValueError):
+			raise CommandError('Plan %s does not exist.' % args[0])
+		
+		reader = READERS.get(options.get('format'))
+		if reader is None:
+			raise CommandError(
+				'Unknown format %s. Use csv or json.' % options.get('format')
+			)
+		
+		try:
+			f = open(args[1], 'rb')
+		except IOError, ex:
+			raise CommandError(unicode(ex))
+		
+		importer = ActionImporter(plan, options.get('chunk_size'))
+		
+		try:
+			for imported in importer.run(reader(f)):
+				print 'Imported %d entries' % imported
+		finally:
+			f.close()
+		
+		for (line, message) in importer.errors:
+			print 'Line %d: %s' % (line, message)
+		
+		print 'Imported %d entries, skipped %d rows' % (
+			importer.imported, importer.failed
+		)
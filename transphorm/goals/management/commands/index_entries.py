@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.core.management.base import BaseCommand
+from optparse import make_option
+
+class Command(BaseCommand):
+	help = 'Rebuilds the full-text search index of log entries.'
+	option_list = BaseCommand.option_list + (
+		make_option('--batch-size', type = 'int', dest = 'batch_size',
+			default = 500,
+			help = 'Number of entries to index at a time.'
+		),
+	)
+	
+	def handle(self, *args, **options):
+		from django.db import transaction, reset_queries
+		from transphorm.goals.models import LogEntry
+		from transphorm.goals.fulltext import get_backend
+		
+		backend = get_backend()
+		backend.setup()
+		
+		batch_size = options.get('batch_size')
+		last_entry = 0
+		indexed = 0
+		
+		@transaction.commit_on_success
+		def index(batch):
+			for entry in batch:
+				backend.index(entry)
+		
+		while True:
+			batch = list(
+				LogEntry.objects.filter(
+					pk__gt = last_entry
+				).order_by('pk')[:batch_size]
+			)
+			
+			if len(batch) == 0:
+				break
+			
+			index(batch)
+			indexed += len(batch)
+			last_entry = batch[-1].pk
+			reset_queries()
+			
+			print 'Indexed %d entries' % indexed
@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.core.management.base import NoArgsCommand
+
+class Command(NoArgsCommand):
+	help = 'Rebuilds the search terms for every goal.'
+	
+	def handle_noargs(self, **options):
+		from django.db import transaction
+		from transphorm.goals.models import Goal
+		from transphorm.goals.search import index_goal
+		
+		@transaction.commit_on_success
+		def index(goals):
+			for goal in goals:
+				index_goal(goal)
+		
+		indexed = 0
+		last_goal = 0
+		
+		while True:
+			goals = list(
+				Goal.objects.filter(pk__gt = last_goal).order_by('pk')[:100]
+			)
+			
+			if len(goals) == 0:
+				break
+			
+			index(goals)
+			indexed += len(goals)
+			last_goal = goals[-1].pk
+			
+			print 'Indexed %d goals' % indexed
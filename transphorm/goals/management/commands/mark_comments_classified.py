@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.core.management.base import BaseCommand, CommandError
+
+class Command(BaseCommand):
+	args = '<date>'
+	help = 'Marks comments made before the given date (when comments ' \
+		'started being checked for spam in the background) as already ' \
+		'checked, so they aren\'t sent to Akismet again.'
+	
+	def handle(self, *args, **options):
+		from django.db import transaction
+		from transphorm.goals.models import LogEntry
+		from transphorm.goals.importer import DATE_FORMATS
+		from datetime import datetime
+		
+		if len(args) != 1:
+			raise CommandError('Please specify a date.')
+		
+		for date_format in DATE_FORMATS:
+			try:
+				before = datetime.strptime(args[0], date_format)
+				break
+			except ValueError:
+				continue
+		else:
+			raise CommandError('%s is not a valid date.' % args[0])
+		
+		marked = transaction.commit_on_success(
+			LogEntry.objects.mark_comments_classified
+		)(before)
+		
+		print 'Marked %d comments as classified' % marked
\ No newline at end of file
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+
+class Command(BaseCommand):
+	help = 'Regenerates the daily points totals from the action log entries.'
+	option_list = BaseCommand.option_list + (
+		make_option('--plan', type = 'int', dest = 'plan',
+			help = 'Only rebuild the totals for the plan with this ID.'
+		),
+	)
+	
+	def handle(self, *args, **options):
+		from django.db import transaction
+		from transphorm.goals.models import Plan, PlanDailyPoints
+		
+		if options.get('plan'):
+			try:
+				plan = Plan.objects.get(pk = options.get('plan'))
+			except Plan.DoesNotExist:
+				raise CommandError(
+					'Plan %d does not exist.' % options.get('plan')
+				)
+		else:
+			plan = None
+		
+		rebuilt = transaction.commit_on_success(
+			PlanDailyPoints.objects.rebuild
+		)(plan)
+		
+		print 'Rebuilt %d daily totals' % rebuilt
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+
+class Command(BaseCommand):
+	help = 'Checks each plan\'s point totals against its action entries ' \
+		'and reward claims, and optionally repairs them.'
+	
+	option_list = BaseCommand.option_list + (
+		make_option('--repair', action = 'store_true', dest = 'repair',
+			default = False,
+			help = 'Fix the totals of any plans that are wrong.'
+		),
+		make_option('--plan', type = 'int', dest = 'plan',
+			help = 'Only check the plan with this ID.'
+		),
+	)
+	
+	def handle(self, *args, **options):
+		from django.db import transaction
+		from transphorm.goals.models import Plan
+		from transphorm.goals.points import drift, repair
+		
+		if options.get('plan'):
+			try:
+				plan = Plan.objects.get(pk = options.get('plan'))
+			except Plan.DoesNotExist:
+				raise CommandError(
+					'Plan %d does not exist.' % options.get('plan')
+				)
+		else:
+			plan = None
+		
+		wrong = drift(plan)
+		for (pk, points, unclaimed, expected, expected_unclaimed) in wrong:
+			print 'Plan %d has %d points (%d unclaimed), expected %d (%d unclaimed)' % (
+				pk, points, unclaimed, expected, expected_unclaimed
+			)
+		
+		if len(wrong) == 0:
+			print 'All plan totals are correct'
+		elif options.get('repair'):
+			updated = transaction.commit_on_success(repair)(
+				[row[0] for row in wrong]
+			)
+			
+			print 'Repaired %d plans' % updated
+		else:
+			print '%d plans have the wrong totals. Use --repair to fix them' % len(wrong)
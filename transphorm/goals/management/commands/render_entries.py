@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.core.management.base import BaseCommand
+from optparse import make_option
+
+class Command(BaseCommand):
+	help = 'Renders the Markdown body of each log entry to HTML.'
+	option_list = BaseCommand.option_list + (
+		make_option('--batch-size', type = 'int', dest = 'batch_size',
+			default = 500,
+			help = 'Number of entries to render at a time.'
+		),
+		make_option('--all', action = 'store_true', dest = 'all',
+			default = False,
+			help = 'Render every entry again, not just those without HTML.'
+		),
+	)
+	
+	def handle(self, *args, **options):
+		from django.db import transaction, reset_queries
+		from transphorm.goals.models import LogEntry
+		
+		batch_size = options.get('batch_size')
+		last_entry = 0
+		rendered = 0
+		
+		entries = LogEntry.objects.all()
+		if not options.get('all'):
+			entries = entries.filter(body_html = '')
+		
+		@transaction.commit_on_success
+		def render(batch):
+			for entry in batch:
+				entry.render_body()
+				
+				# Only write the HTML, so none of the save signals fire
+				LogEntry.objects.filter(pk = entry.pk).update(
+					body_html = entry.body_html
+				)
+		
+		while True:
+			batch = list(
+				entries.filter(
+					pk__gt = last_entry
+				).order_by('pk')[:batch_size]
+			)
+			
+			if len(batch) == 0:
+				break
+			
+			render(batch)
+			rendered += len(batch)
+			last_entry = batch[-1].pk
+			reset_queries()
+			
+			print 'Rendered %d entries' % rendered
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.core.management.base import BaseCommand
+from optparse import make_option
+
+class Command(BaseCommand):
+	help = 'Recalculates when each plan\'s next reminder emails are due.'
+	option_list = BaseCommand.option_list + (
+		make_option('--batch-size', type = 'int', dest = 'batch_size',
+			default = 500,
+			help = 'Number of plans to update at a time.'
+		),
+	)
+	
+	def handle(self, *args, **options):
+		from django.db.models import Max
+		from django.db import transaction
+		from transphorm.goals.models import Plan, UserEmail, \
+			MILESTONE_REMINDER_INTERVAL
+		from datetime import timedelta
+		
+		batch_size = options.get('batch_size')
+		last_plan = 0
+		updated = 0
+		
+		def latest_emails(ids, **kwargs):
+			return dict(
+				UserEmail.objects.filter(
+					plan__in = ids, **kwargs
+				).order_by().values('plan').annotate(
+					latest = Max('date')
+				).values_list('plan', 'latest')
+			)
+		
+		@transaction.commit_on_success
+		def reschedule(plans):
+			ids = [pk for (pk, frequency) in plans]
+			latest = latest_emails(ids)
+			latest_reminders = latest_emails(ids, kind = 'mr')
+			
+			for pk, frequency in plans:
+				next_reminder_due = None
+				next_milestone_reminder_due = None
+				
+				if pk in latest:
+					next_reminder_due = latest[pk] + timedelta(
+						days = frequency
+					)
+				
+				if pk in latest_reminders:
+					next_milestone_reminder_due = latest_reminders[pk] + \
+						timedelta(days = MILESTONE_REMINDER_INTERVAL)
+				
+				Plan.objects.filter(pk = pk).update(
+					next_reminder_due = next_reminder_due,
+					next_milestone_reminder_due = next_milestone_reminder_due
+				)
+		
+		while True:
+			plans = list(
+				Plan.objects.filter(
+					pk__gt = last_plan
+				).order_by('pk').values_list(
+					'pk', 'email_frequency'
+				)[:batch_size]
+			)
+			
+			if len(plans) == 0:
+				break
+			
+			reschedule(plans)
+			updated += len(plans)
+			last_plan = plans[-1][0]
+			
+			print 'Rescheduled %d plans' % updated
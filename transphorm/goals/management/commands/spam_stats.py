@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.core.management.base import NoArgsCommand
+
+class Command(NoArgsCommand):
+	help = 'Shows how many comments the spam pre-filter has classified ' \
+		'without asking Akismet.'
+	
+	def handle_noargs(self, **options):
+		from transphorm.goals.spam import prefilter_stats
+		
+		stats = prefilter_stats()
+		print 'From the verdict cache: %d' % stats['cached']
+		print 'By the local spam model: %d' % stats['local']
+		print 'Sent to Akismet: %d' % stats['remote']
+		print 'Hit ratio: %.1f%%' % (stats['hit_ratio'] * 100)
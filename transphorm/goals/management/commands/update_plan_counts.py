@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.core.management.base import NoArgsCommand
+
+class Command(NoArgsCommand):
+	help = 'Counts the live plans for each goal again.'
+	
+	def handle_noargs(self, **options):
+		from django.db import transaction
+		from transphorm.goals.models import Goal
+		
+		transaction.commit_on_success(
+			Goal.objects.update_plan_counts
+		)()
+		
+		print 'Updated the plan counts for %d goals' % Goal.objects.count()
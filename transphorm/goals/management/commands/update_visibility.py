@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.core.management.base import BaseCommand
+from optparse import make_option
+
+class Command(BaseCommand):
+	help = 'Sets the visibility of every log entry from its comment.'
+	option_list = BaseCommand.option_list + (
+		make_option('--classified-before', dest = 'classified_before',
+			help = 'First mark comments made before this date as ' \
+				'classified (see mark_comments_classified).'
+		),
+	)
+	
+	def handle(self, *args, **options):
+		from django.core.management import call_command
+		from django.db import transaction
+		from transphorm.goals.models import LogEntry
+		
+		# Comments that haven't been classified are hidden, so older ones
+		# need marking first
+		if options.get('classified_before'):
+			call_command(
+				'mark_comments_classified', options.get('classified_before')
+			)
+		
+		updated = transaction.commit_on_success(
+			LogEntry.objects.update_visibility
+		)()
+		
+		print 'Updated the visibility of %d log entries' % updated
@@ -6,21 +6,86 @@ from django.db import models
 class GoalManager(models.Manager):
 	def most_popular(self):
 		return self.filter(
-			plans__live = True
-		).annotate(
-			plan_count = models.Count('plans')
+			plan_count__gt = 0
 		).order_by(
 			'-plan_count'
 		)
+	
+	def update_plan_counts(self):
+		"""
+		Count the live plans for every goal again, with a single UPDATE
+		"""
+		
+		from django.db import connection, transaction
+		from transphorm.goals.models import Plan
+		
+		qn = connection.ops.quote_name
+		cursor = connection.cursor()
+		cursor.execute(
+			"""UPDATE %(goal)s SET plan_count = (
+				SELECT COUNT(*) FROM %(plan)s p
+				WHERE p.goal_id = %(goal)s.id AND p.live = %%s
+			)""" % {
+				'goal': qn(self.model._meta.db_table),
+				'plan': qn(Plan._meta.db_table)
+			},
+			[True]
+		)
+		
+		transaction.commit_unless_managed()
 
 class LogEntryManager(models.Manager):
 	def not_spam(self):
-		q = models.Q(comment__isnull = True) | models.Q(comment__is_spam = False)
-		return self.filter(q)
+		return self.filter(visibility__in = ('v', 'p'))
 	
 	def approved(self):
-		q = models.Q(comment__isnull = True) | models.Q(comment__is_approved = True)
-		return self.not_spam().filter(q)
+		return self.filter(visibility = 'v')
+	
+	def mark_comments_classified(self, before):
+		"""
+		Mark the comments made before comments were checked in the background
+		as classified, since they were checked when they were made. This is an
+		UPDATE, so no comment_classified signal is sent and nobody is emailed
+		about them again. Returns the number of comments marked.
+		"""
+		
+		from transphorm.goals.models import Comment
+		
+		return Comment.objects.filter(
+			is_classified = False, date__lt = before
+		).update(is_classified = True)
+	
+	def update_visibility(self):
+		"""
+		Set the visibility of every entry from its comment (if it has one),
+		with an UPDATE for each state. Only entries whose visibility is wrong
+		are written, and the number changed is returned.
+		"""
+		
+		from transphorm.goals.models import Comment
+		
+		updated = self.filter(comment__isnull = True).exclude(
+			visibility = 'v'
+		).update(visibility = 'v')
+		
+		comments = Comment.objects.all()
+		states = (
+			('u', {'is_classified': False}),
+			('s', {'is_classified': True, 'is_spam': True}),
+			('v', {
+				'is_classified': True, 'is_spam': False, 'is_approved': True
+			}),
+			('p', {
+				'is_classified': True, 'is_spam': False, 'is_approved': False
+			})
+		)
+		
+		for (visibility, kwargs) in states:
+			updated += comments.filter(**kwargs).exclude(
+				visibility = visibility
+			).update(visibility = visibility)
+		
+		return updated
 
 class RewardManager(models.Manager):
 	def unclaimed(self, user):
@@ -34,4 +99,112 @@ class RewardManager(models.Manager):
 			points__lte = unclaimed_points,
 			plan__live = True,
 			plan__user = user
-		)
\ No newline at end of file
+		)
+
+class UserEmailManager(models.Manager):
+	def due(self, now = None):
+		"""
+		Emails waiting to be sent, including any whose previous sending
+		attempt was abandoned part-way through
+		"""
+		
+		from datetime import datetime
+		now = now or datetime.now()
+		
+		q = models.Q(
+			status = 'queued', next_attempt_at__isnull = True
+		) | models.Q(
+			status__in = ('queued', 'sending'), next_attempt_at__lte = now
+		)
+		
+		return self.filter(q)
+
+class DailyPointsManager(models.Manager):
+	def record(self, plan_id, day, action_id, points, entries = 1):
+		"""
+		Add points (and a number of entries) to a plan's total for an action
+		on a given day. Pass negative numbers to take them away again.
+		"""
+		
+		from django.db import transaction, IntegrityError
+		
+		kwargs = {
+			'plan__pk': plan_id,
+			'day': day,
+			'action__pk': action_id
+		}
+		
+		def update():
+			return self.filter(**kwargs).update(
+				points = models.F('points') + points,
+				entries = models.F('entries') + entries
+			)
+		
+		if not update():
+			sid = transaction.savepoint()
+			
+			try:
+				self.create(
+					plan_id = plan_id,
+					day = day,
+					action_id = action_id,
+					points = points,
+					entries = entries
+				)
+				
+				transaction.savepoint_commit(sid)
+			except IntegrityError:
+				# Another process created the row first
+				transaction.savepoint_rollback(sid)
+				update()
+		
+		self.filter(entries__lte = 0, **kwargs).delete()
+	
+	def rebuild(self, plan = None):
+		"""
+		Regenerate the daily totals from the action log entries, with a
+		single INSERT ... SELECT. Returns the number of totals written.
+		"""
+		
+		from django.db import connection, transaction
+		from transphorm.goals.models import LogEntry, ActionEntry, Action
+		
+		qn = connection.ops.quote_name
+		rollups = self.all()
+		where = ''
+		params = []
+		
+		if not plan is None:
+			rollups = rollups.filter(plan = plan)
+			where = 'WHERE le.plan_id = %s'
+			params.append(plan.pk)
+		
+		rollups.delete()
+		
+		# The points sum must follow the same rule as
+		# ActionEntry.calculate_points
+		cursor = connection.cursor()
+		cursor.execute(
+			"""INSERT INTO %(rollup)s (plan_id, day, action_id, points, entries)
+			SELECT le.plan_id, DATE(le.date), ae.action_id,
+				SUM(
+					CASE WHEN a.kind = 'sc' AND ae.value IS NOT NULL
+					THEN ae.value * a.points ELSE a.points END
+				),
+				COUNT(*)
+			FROM %(entry)s ae
+			INNER JOIN %(logentry)s le ON le.id = ae.logentry_ptr_id
+			INNER JOIN %(action)s a ON a.id = ae.action_id
+			%(where)s
+			GROUP BY le.plan_id, DATE(le.date), ae.action_id""" % {
+				'rollup': qn(self.model._meta.db_table),
+				'entry': qn(ActionEntry._meta.db_table),
+				'logentry': qn(LogEntry._meta.db_table),
+				'action': qn(Action._meta.db_table),
+				'where': where
+			},
+			params
+		)
+		
+		transaction.commit_unless_managed()
+		return cursor.rowcount
\ No newline at end of file
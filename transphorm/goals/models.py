@@ -4,11 +4,12 @@
 from django.db import models
 from django.contrib.auth.models import User
 from transphorm.goals.managers import GoalManager, RewardManager, \
-	LogEntryManager
+	LogEntryManager, UserEmailManager, DailyPointsManager
 from datetime import date, datetime, timedelta
 
 POINT_CHOICES = tuple([(x, str(x)) for x in range(-100, 110, 10)])
 AVAILABLE_POINT_CHOICES = tuple([(x, str(x)) for x in range(10, 10100, 100)])
+MILESTONE_REMINDER_INTERVAL = 5
 MEASUREMENTS = (
 	('in', 'inch', 'inches', 'inches'),
 	('yd', 'yard', 'yards', 'yards'),
@@ -70,11 +71,23 @@ class Goal(models.Model):
 	)
 	has_deadline = models.BooleanField('has a deadline')
 	live = models.BooleanField(default = True)
+	
+	# The number of live plans for this goal, kept up to date by Plan.save()
+	# so goals can be sorted by popularity without counting plans
+	plan_count = models.PositiveIntegerField(
+		editable = False, default = 0, db_index = True
+	)
+	
 	objects = GoalManager()
 	
 	def original_plan(self):
 		return self.plans.get(original__isnull = True, live = True)
 	
+	def add_plans(self, count):
+		Goal.objects.filter(pk = self.pk).update(
+			plan_count = models.F('plan_count') + count
+		)
+	
 	def save(self, *args, **kwargs):
 		if not self.slug:
 			from django.template.defaultfilters import slugify
@@ -85,6 +98,22 @@ class Goal(models.Model):
 	def __unicode__(self):
 		return self.name
 
+class GoalSearchTerm(models.Model):
+	"""
+	A prefix of a goal's name, or of its name from one of its words onwards,
+	so goals can be found as the user types with an indexed equality match.
+	These are kept up to date by transphorm.goals.search.index_goal().
+	"""
+	
+	goal = models.ForeignKey(Goal, related_name = 'search_terms')
+	term = models.CharField(max_length = 30, db_index = True)
+	
+	def __unicode__(self):
+		return self.term
+	
+	class Meta:
+		unique_together = ('goal', 'term')
+
 class Plan(models.Model):
 	goal = models.ForeignKey(Goal, related_name = 'plans')
 	user = models.ForeignKey(User, related_name = 'plans')
@@ -123,9 +152,81 @@ class Plan(models.Model):
 		editable = False, default = 0
 	)
 	
+	# When the next action and milestone reminders are due. These are empty
+	# if the user has never been sent one, in which case it's due right away
+	next_reminder_due = models.DateTimeField(
+		null = True, blank = True, editable = False, db_index = True
+	)
+	
+	next_milestone_reminder_due = models.DateTimeField(
+		null = True, blank = True, editable = False, db_index = True
+	)
+	
 	def __unicode__(self):
 		return u'%s wants to %s' % (self.user, self.goal.name)
 	
+	def save(self, *args, **kwargs):
+		# A plan with a primary key but no row (given an explicit ID, or
+		# deleted elsewhere) counts as new
+		was_live = bool(self.pk) and Plan.objects.filter(
+			pk = self.pk, live = True
+		).exists()
+		
+		super(Plan, self).save(*args, **kwargs)
+		
+		if self.live and not was_live:
+			self.goal.add_plans(1)
+		elif was_live and not self.live:
+			self.goal.add_plans(-1)
+	
+	def reschedule(self, commit = True):
+		"""
+		Work out when the next action and milestone reminders are due, based
+		on the emails already sent and the plan's email frequency
+		"""
+		
+		try:
+			self.next_reminder_due = self.emails.latest().date + timedelta(
+				days = self.email_frequency
+			)
+		except UserEmail.DoesNotExist:
+			self.next_reminder_due = None
+		
+		try:
+			self.next_milestone_reminder_due = self.emails.filter(
+				kind = 'mr'
+			).latest().date + timedelta(days = MILESTONE_REMINDER_INTERVAL)
+		except UserEmail.DoesNotExist:
+			self.next_milestone_reminder_due = None
+		
+		if commit:
+			Plan.objects.filter(pk = self.pk).update(
+				next_reminder_due = self.next_reminder_due,
+				next_milestone_reminder_due = self.next_milestone_reminder_due
+			)
+	
+	def add_points(self, points = 0, unclaimed = 0):
+		"""
+		Add to the plan's point totals with a single UPDATE, so concurrent
+		entries and claims don't overwrite each other. Only the points
+		columns are written, and the instance's own totals are left as they
+		are; call refresh_points() if you need the new ones.
+		"""
+		
+		Plan.objects.filter(pk = self.pk).update(
+			points = models.F('points') + points,
+			points_unclaimed = models.F('points_unclaimed') + unclaimed
+		)
+	
+	def refresh_points(self):
+		"""
+		Reload the plan's point totals from the database
+		"""
+		
+		self.points, self.points_unclaimed = Plan.objects.filter(
+			pk = self.pk
+		).values_list('points', 'points_unclaimed')[0]
+	
 	@models.permalink
 	def get_absolute_url(self):
 		return (
@@ -258,7 +359,7 @@ class Milestone(models.Model):
 		max_length = 50,
 		help_text = 'eg: &ldquo;First two weeks&rdquo;'
 	)
-	deadline = models.DateField()
+	deadline = models.DateField(db_index = True)
 	reached = models.DateTimeField(null = True, blank = True)
 	points = models.IntegerField(
 		'target points', choices = AVAILABLE_POINT_CHOICES,
@@ -305,6 +406,7 @@ class LogEntry(models.Model):
 	plan = models.ForeignKey(Plan, related_name = 'log_entries')
 	date = models.DateTimeField(default = datetime.now())
 	body = models.TextField()
+	body_html = models.TextField(editable = False, blank = True)
 	kind = models.CharField(
 		max_length = 1, editable = False, choices = (
 			('l', 'Comment'),
@@ -316,6 +418,18 @@ class LogEntry(models.Model):
 		default = 'l'
 	)
 	
+	# Whether the entry can be seen, kept here so visible entries can be
+	# found without looking at the comments table. See get_visibility()
+	visibility = models.CharField(
+		max_length = 1, editable = False, choices = (
+			('v', 'Visible'),
+			('p', 'Awaiting approval'),
+			('u', 'Awaiting classification'),
+			('s', 'Spam'),
+		),
+		default = 'v'
+	)
+	
 	objects = LogEntryManager()
 	
 	def __init__(self, *args, **kwargs):
@@ -324,6 +438,23 @@ class LogEntry(models.Model):
 	def __unicode__(self):
 		return self.date.strftime('%Y-%m-%d, %H:%i')
 	
+	def render_body(self):
+		"""
+		Render the entry's Markdown body as HTML. This is done when the entry
+		is saved, so it doesn't need doing every time the entry is shown.
+		"""
+		
+		from django.contrib.markup.templatetags.markup import markdown
+		self.body_html = unicode(markdown(self.body))
+	
+	def get_visibility(self):
+		return 'v'
+	
+	def save(self, *args, **kwargs):
+		self.render_body()
+		self.visibility = self.get_visibility()
+		super(LogEntry, self).save(*args, **kwargs)
+	
 	@models.permalink
 	def get_absolute_url(self):
 		return (
@@ -343,17 +474,31 @@ class ActionEntry(LogEntry):
 	def __init__(self, *args, **kwargs):
 		super(ActionEntry, self).__init__(*args, **kwargs)
 		self.kind = 'a'
+		
+		# Kept so that the daily totals can be moved when an entry is edited
+		self._original = (self.date, self.action_id, self.value)
 	
-	def points_value(self):
+	@staticmethod
+	def calculate_points(kind, value, points):
+		"""
+		Return the points for an entry against an action of the given kind
+		and points. Scale actions multiply their points by the value logged.
+		"""
+		
 		try:
-			value = int(self.value)
+			value = int(value)
 		except (ValueError, TypeError):
-			pass
+			value = None
 		
-		if self.action.kind == 'sc':
-			return value * self.action.points
+		if kind == 'sc' and not value is None:
+			return value * points
 		else:
-			return self.action.points
+			return points
+	
+	def points_value(self):
+		return ActionEntry.calculate_points(
+			self.action.kind, self.value, self.action.points
+		)
 	
 	def humanise(self, value):
 		try:
@@ -386,6 +531,22 @@ class ActionEntry(LogEntry):
 		
 		super(ActionEntry, self).save(*args, **kwargs)
 
+class PlanDailyPoints(models.Model):
+	plan = models.ForeignKey(Plan, related_name = 'daily_points')
+	day = models.DateField()
+	action = models.ForeignKey(Action, related_name = 'daily_points')
+	points = models.IntegerField(default = 0)
+	entries = models.IntegerField(default = 0)
+	objects = DailyPointsManager()
+	
+	def __unicode__(self):
+		return u'%d points on %s' % (self.points, self.day)
+	
+	class Meta:
+		ordering = ('day',)
+		unique_together = ('plan', 'day', 'action')
+		verbose_name_plural = 'plan daily points'
+
 class RewardClaim(LogEntry):
 	reward = models.ForeignKey(Reward, related_name = 'claims')
 	
@@ -430,44 +591,41 @@ class Comment(LogEntry):
 	email = models.EmailField()
 	is_approved = models.BooleanField()
 	is_spam = models.BooleanField()
+	
+	# Comments are checked for spam in the background, by the
+	# classify_comments management command. Until then they're hidden
+	is_classified = models.BooleanField(editable = False)
 	ip = models.CharField(max_length = 20, editable = False)
 	user_agent = models.CharField(max_length = 255, editable = False)
 	
 	def __init__(self, *args, **kwargs):
 		super(Comment, self).__init__(*args, **kwargs)
 		self.kind = 'c'
+	
+	def get_visibility(self):
+		if not self.is_classified:
+			return 'u'
 		
-	def save(self, *args, **kwargs):
-		from akismet import Akismet
-		from django.conf import settings
+		if self.is_spam:
+			return 's'
 		
-		if not self.pk:
-			api = Akismet(agent = 'transphorm/akismet 0.1')
-			api.setAPIKey(
-				getattr(settings, 'AKISMET_KEY')
-			)
-			
-			print 'Set API key'
-			
-			data = {
-				'comment_author': self.name,
-				'comment_author_url': self.website,
-				'user_ip': self.ip,
-				'user_agent': self.user_agent
-			}
-			
-			if api.comment_check(self.body, data):
-				print 'Comment is SPAM'
-				self.is_spam = True
-			else:
-				print 'Comment is NOT spam'
+		if self.is_approved:
+			return 'v'
 		
-		super(Comment, self).save(*args, **kwargs)
+		return 'p'
 
 class UserEmail(models.Model):
+	STATUS_CHOICES = (
+		('queued', 'Queued'),
+		('sending', 'Sending'),
+		('sent', 'Sent'),
+		('failed', 'Failed'),
+	)
+	
 	plan = models.ForeignKey(Plan, related_name = 'emails')
 	subject = models.CharField(max_length = 255)
 	body = models.TextField()
+	html = models.TextField(blank = True)
 	date = models.DateTimeField(auto_now_add = True)
 	deleted = models.BooleanField()
 	kind = models.CharField(
@@ -479,65 +637,67 @@ class UserEmail(models.Model):
 		)
 	)
 	
+	status = models.CharField(
+		max_length = 7, choices = STATUS_CHOICES, default = 'queued',
+		db_index = True, editable = False
+	)
+	
+	attempts = models.PositiveIntegerField(default = 0, editable = False)
+	next_attempt_at = models.DateTimeField(
+		null = True, blank = True, db_index = True, editable = False
+	)
+	
+	last_error = models.TextField(blank = True, editable = False)
+	objects = UserEmailManager()
+	
 	def __unicode__(self):
 		return self.subject
 	
 	def save(self, *args, **kwargs):
-		if not self.pk:
+		created = not self.pk
+		if created:
 			self.subject = self.get_kind_display()
 		
 		super(UserEmail, self).save(*args, **kwargs)
-	
-	def prepare_message(self, site, **kwargs):
-		from django.core.mail import EmailMultiAlternatives
-		from django.conf import settings
-		from django.template.loader import render_to_string
-		
-		if self.kind == 'ar':
-			template = 'plan/email/action-log-reminder.txt'
-		elif self.kind == 'mr':
-			template = 'plan/email/milestone-reminder.txt'
-		elif self.kind == 'mh':
-			template = 'plan/email/milestone-hit.txt'
-		elif self.kind == 'mm':
-			template = 'plan/email/milestone-miss.txt'
-		
-		milestones = self.plan.milestones.filter(
-			deadline__gt = datetime.now(),
-			reached__isnull = True
-		)[:1]
-		
-		if milestones.count() > 0:
-			next_milestone = milestones[0]
-		else:
-			next_milestone = None
 		
-		unclaimed_rewards = self.plan.rewards.unclaimed(self.plan.user)
-		if unclaimed_rewards.count() == 0:
-			unclaimed_rewards = None
-		
-		context = {
-			'plan': self.plan,
-			'user': self.plan.user,
-			'site': site,
-			'unclaimed_rewards': unclaimed_rewards,
-			'next_milestone': next_milestone
-		}
+		# Move the plan's reminder schedule on, as this is now the latest
+		# email sent for it
+		if created:
+			plan = self.plan
+			plan.next_reminder_due = self.date + timedelta(
+				days = plan.email_frequency
+			)
+			
+			if self.kind == 'mr':
+				plan.next_milestone_reminder_due = self.date + timedelta(
+					days = MILESTONE_REMINDER_INTERVAL
+				)
+			
+			Plan.objects.filter(pk = plan.pk).update(
+				next_reminder_due = plan.next_reminder_due,
+				next_milestone_reminder_due = plan.next_milestone_reminder_due
+			)
+	
+	def render(self, site, renderer = None, **kwargs):
+		"""
+		Render the plain text and HTML versions of the email, ready to be
+		queued for sending. When rendering a batch of emails, pass in a
+		shared EmailRenderer so the templates are only compiled once.
+		"""
 		
-		context.update(kwargs)
+		if renderer is None:
+			from transphorm.goals.emails import EmailRenderer
+			renderer = EmailRenderer(site)
 		
-		body = render_to_string(
-			template,
-			context
-		)
+		renderer.render(self, **kwargs)
+	
+	def prepare_message(self):
+		"""
+		Build the message to be sent, from the previously-rendered body
+		"""
 		
-		html_content = render_to_string(
-			'plan/email/base.html',
-			{
-				'body': body,
-				'site': site
-			}
-		)
+		from django.core.mail import EmailMultiAlternatives
+		from django.conf import settings
 		
 		message = EmailMultiAlternatives(
 			self.subject,
@@ -547,7 +707,7 @@ class UserEmail(models.Model):
 		)
 		
 		message.attach_alternative(
-			html_content, 'text/html'
+			self.html, 'text/html'
 		)
 		
 		return message
@@ -556,4 +716,21 @@ class UserEmail(models.Model):
 		ordering = ('-date',)
 		get_latest_by = 'date'
 
+class CronCheckpoint(models.Model):
+	day = models.DateField()
+	shard = models.PositiveIntegerField()
+	shards = models.PositiveIntegerField()
+	last_plan = models.PositiveIntegerField(default = 0)
+	finished = models.BooleanField()
+	updated = models.DateTimeField(auto_now = True)
+	
+	def __unicode__(self):
+		return u'Shard %d of %d for %s' % (
+			self.shard + 1, self.shards, self.day
+		)
+	
+	class Meta:
+		ordering = ('-day', 'shard')
+		unique_together = ('day', 'shard', 'shards')
+
 from transphorm.goals.management import *
\ No newline at end of file
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.conf import settings
+from transphorm.goals.models import UserEmail
+from datetime import datetime, timedelta
+import threading, Queue
+
+class Dispatcher(object):
+	"""
+	Drains the queue of UserEmail objects, a chunk at a time. Each chunk is
+	sent over a bounded number of SMTP connections running in parallel, and
+	emails that can't be sent are retried with an exponential backoff until
+	they run out of attempts.
+	"""
+	
+	def __init__(self, connections = None, chunk_size = None,
+		max_attempts = None, backoff = None, lease = None):
+		self.connections = connections or getattr(
+			settings, 'EMAIL_DISPATCH_CONNECTIONS', 4
+		)
+		
+		self.chunk_size = chunk_size or getattr(
+			settings, 'EMAIL_DISPATCH_CHUNK_SIZE', 100
+		)
+		
+		self.max_attempts = max_attempts or getattr(
+			settings, 'EMAIL_DISPATCH_MAX_ATTEMPTS', 5
+		)
+		
+		# Number of seconds to wait before the first retry. This doubles
+		# with each failed attempt
+		self.backoff = backoff or getattr(
+			settings, 'EMAIL_DISPATCH_BACKOFF', 60
+		)
+		
+		# Number of seconds an email can stay in the "sending" state before
+		# we assume its dispatcher died, and pick it up again
+		self.lease = lease or getattr(
+			settings, 'EMAIL_DISPATCH_LEASE', 600
+		)
+	
+	def claim(self):
+		"""
+		Mark a chunk of due emails as being sent, and return them. Each email
+		is claimed with its own conditional update, so two dispatchers
+		running at once won't send the same email twice.
+		"""
+		
+		now = datetime.now()
+		due = UserEmail.objects.due(now).order_by('date')
+		claimed = []
+		
+		for pk in due.values_list('pk', flat = True)[:self.chunk_size]:
+			if UserEmail.objects.due(now).filter(pk = pk).update(
+				status = 'sending',
+				next_attempt_at = now + timedelta(seconds = self.lease)
+			):
+				claimed.append(pk)
+		
+		if len(claimed) == 0:
+			return []
+		
+		return list(
+			UserEmail.objects.filter(
+				pk__in = claimed
+			).select_related('plan__user')
+		)
+	
+	def send(self, emails):
+		"""
+		Send the given emails over up to the configured number of SMTP
+		connections, and return a dictionary mapping email IDs to an error
+		message (or None if the email was sent)
+		"""
+		
+		from django.core.mail import get_connection
+		
+		pending = Queue.Queue()
+		results = {}
+		lock = threading.Lock()
+		
+		for email in emails:
+			pending.put(email)
+		
+		def worker():
+			connection = None
+			
+			while True:
+				try:
+					email = pending.get_nowait()
+				except Queue.Empty:
+					break
+				
+				try:
+					if connection is None:
+						connection = get_connection(fail_silently = False)
+						connection.open()
+					
+					connection.send_messages([email.prepare_message()])
+					error = None
+				except Exception, ex:
+					error = unicode(ex) or ex.__class__.__name__
+					
+					# Start afresh with a new connection for the next email,
+					# as this one may well have been dropped
+					if not connection is None:
+						try:
+							connection.close()
+						except Exception:
+							pass
+						
+						connection = None
+				
+				lock.acquire()
+				results[email.pk] = error
+				lock.release()
+			
+			if not connection is None:
+				connection.close()
+		
+		threads = [
+			threading.Thread(target = worker)
+			for i in range(min(self.connections, len(emails)))
+		]
+		
+		for thread in threads:
+			thread.start()
+		
+		for thread in threads:
+			thread.join()
+		
+		return results
+	
+	def record(self, emails, results):
+		"""
+		Update the delivery state of each email based on the results of
+		sending it
+		"""
+		
+		now = datetime.now()
+		sent = []
+		failed = []
+		
+		for email in emails:
+			error = results.get(email.pk, 'Not sent')
+			email.attempts += 1
+			
+			if error is None:
+				email.status = 'sent'
+				email.next_attempt_at = None
+				email.last_error = ''
+				sent.append(email)
+			else:
+				if email.attempts >= self.max_attempts:
+					email.status = 'failed'
+					email.next_attempt_at = None
+				else:
+					email.status = 'queued'
+					email.next_attempt_at = now + timedelta(
+						seconds = self.backoff * 2 ** (email.attempts - 1)
+					)
+				
+				email.last_error = error
+				failed.append(email)
+			
+			UserEmail.objects.filter(pk = email.pk).update(
+				status = email.status,
+				attempts = email.attempts,
+				next_attempt_at = email.next_attempt_at,
+				last_error = email.last_error
+			)
+		
+		return sent, failed
+	
+	def dispatch(self):
+		"""
+		Claim, send and record a single chunk of emails. Returns a tuple of
+		sent and failed emails, both of which are empty once the queue has
+		been drained.
+		"""
+		
+		emails = self.claim()
+		if len(emails) == 0:
+			return [], []
+		
+		return self.record(emails, self.send(emails))
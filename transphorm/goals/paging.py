@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.db.models import Q
+from datetime import datetime
+
+CURSOR_DATE_FORMAT = '%Y%m%d%H%M%S%f'
+
+def make_cursor(entry):
+	"""
+	Return a cursor pointing at the given entry, made up of its date and ID
+	"""
+	
+	return '%s-%d' % (entry.date.strftime(CURSOR_DATE_FORMAT), entry.pk)
+
+def parse_cursor(cursor):
+	"""
+	Return the date and ID from a cursor, or None if it's invalid
+	"""
+	
+	try:
+		date, pk = cursor.split('-')
+		return datetime.strptime(date, CURSOR_DATE_FORMAT), int(pk)
+	except (ValueError, AttributeError):
+		return None
+
+class KeysetPage(object):
+	"""
+	A page of log entries, newest first, fetched by seeking past the date and
+	ID of the last entry on the page before (or the first entry on the page
+	after) rather than by counting and offsetting. Fetching a page costs the
+	same however far back it is.
+	
+	The older and newer cursors point at the last and first entries on the
+	page, and are None if there are no entries beyond them.
+	"""
+	
+	def __init__(self, entries, per_page = 20, before = None, after = None,
+		page = None):
+		self.per_page = per_page
+		self.older = None
+		self.newer = None
+		
+		if not after is None:
+			date, pk = after
+			object_list = list(
+				entries.filter(
+					Q(date__gt = date) | Q(date = date, pk__gt = pk)
+				).order_by('date', 'pk')[:per_page + 1]
+			)
+			
+			has_newer = len(object_list) > per_page
+			object_list = object_list[:per_page]
+			object_list.reverse()
+			
+			# The entry the cursor points at is older than this page
+			has_older = True
+		else:
+			entries = entries.order_by('-date', '-pk')
+			
+			if not before is None:
+				date, pk = before
+				entries = entries.filter(
+					Q(date__lt = date) | Q(date = date, pk__lt = pk)
+				)
+				
+				has_newer = True
+				offset = 0
+			elif page > 1:
+				# Old ?page=N links still work, with an offset but no count
+				has_newer = True
+				offset = (page - 1) * per_page
+			else:
+				has_newer = False
+				offset = 0
+			
+			object_list = list(entries[offset:offset + per_page + 1])
+			has_older = len(object_list) > per_page
+			object_list = object_list[:per_page]
+		
+		self.object_list = object_list
+		
+		if len(object_list) > 0:
+			if has_older:
+				self.older = make_cursor(object_list[-1])
+			
+			if has_newer:
+				self.newer = make_cursor(object_list[0])
+	
+	def has_next(self):
+		return not self.older is None
+	
+	def has_previous(self):
+		return not self.newer is None
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.db.models import Q
+from transphorm.goals.models import Plan, Milestone, \
+	MILESTONE_REMINDER_INTERVAL
+from datetime import timedelta
+
+# Number of days before a milestone's deadline to start reminding
+MILESTONE_REMINDER_WINDOW = 3
+
+def due_plans(plans, now):
+	"""
+	Narrow a queryset of plans down to those that might need an email: ones
+	whose next reminder is due, or that have a milestone coming up
+	"""
+	
+	return plans.filter(
+		Q(next_reminder_due__lte = now) |
+		Q(next_reminder_due__isnull = True) |
+		Q(
+			milestones__deadline__range = (
+				now, now + timedelta(days = MILESTONE_REMINDER_WINDOW)
+			),
+			milestones__reached__isnull = True,
+			milestones__send_emails = True
+		)
+	).distinct()
+
+class CronPlanner(object):
+	"""
+	Works out which emails the nightly cron job needs to send. Due plans are
+	found with a range scan over the plans' indexed reminder schedules, and
+	milestones with a range scan over their deadlines, so the cost of
+	planning tracks the number of emails due rather than the number of plans.
+	"""
+	
+	MILESTONE_REMINDER_INTERVAL = MILESTONE_REMINDER_INTERVAL
+	MILESTONE_REMINDER_WINDOW = MILESTONE_REMINDER_WINDOW
+	
+	def __init__(self, now, plans = None):
+		if plans is None:
+			plans = Plan.objects.filter(live = True).exclude(
+				email_frequency = 0
+			)
+		
+		self.now = now
+		self.plans = plans
+		self.queries = 0
+	
+	def _evaluate(self, queryset):
+		self.queries += 1
+		return list(queryset)
+	
+	def _plan_ids(self):
+		return self.plans.order_by().values('pk')
+	
+	def _milestones(self, *args, **kwargs):
+		"""
+		Return a dictionary mapping plan IDs to lists of milestones that
+		want emails sending, in deadline order
+		"""
+		
+		milestones = Milestone.objects.filter(
+			plan__in = self._plan_ids(),
+			reached__isnull = True,
+			send_emails = True
+		).filter(
+			*args, **kwargs
+		).select_related('plan__user', 'plan__goal')
+		
+		grouped = {}
+		for milestone in self._evaluate(milestones):
+			grouped.setdefault(milestone.plan_id, []).append(milestone)
+		
+		return grouped
+	
+	def plan(self):
+		"""
+		Return a list of (plan, kind, milestone) tuples, in the order in which
+		the emails should be created. The kind is one of the UserEmail kinds,
+		and milestone is None for action reminders.
+		"""
+		
+		now = self.now
+		reminders_due = self._evaluate(
+			self.plans.filter(
+				Q(next_reminder_due__lte = now) |
+				Q(next_reminder_due__isnull = True)
+			).select_related('user', 'goal')
+		)
+		
+		# Only send milestone reminders if enough days have passed since the
+		# last one
+		upcoming_milestones = self._milestones(
+			Q(plan__next_milestone_reminder_due__lte = now) |
+			Q(plan__next_milestone_reminder_due__isnull = True),
+			deadline__range = (
+				now, now + timedelta(days = self.MILESTONE_REMINDER_WINDOW)
+			)
+		)
+		
+		milestones_today = self._milestones(deadline = now.date())
+		plans = dict([(plan.pk, plan) for plan in reminders_due])
+		reminder_ids = set(plans.keys())
+		
+		for grouped in (upcoming_milestones, milestones_today):
+			for milestones in grouped.values():
+				for milestone in milestones:
+					plans.setdefault(milestone.plan_id, milestone.plan)
+		
+		emails = []
+		for pk in sorted(plans.keys()):
+			plan = plans[pk]
+			
+			if pk in reminder_ids:
+				emails.append((plan, 'ar', None))
+			
+			for milestone in upcoming_milestones.get(pk, []):
+				milestone.plan = plan
+				emails.append((plan, 'mr', milestone))
+			
+			for milestone in milestones_today.get(pk, []):
+				milestone.plan = plan
+				
+				if milestone.points_remaining() > 0:
+					emails.append((plan, 'mm', milestone))
+				else:
+					emails.append((plan, 'mh', milestone))
+		
+		return emails
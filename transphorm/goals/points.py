@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.db import connection, transaction
+from transphorm.goals.models import Plan, LogEntry, ActionEntry, Action, \
+	Reward, RewardClaim
+
+def tables():
+	qn = connection.ops.quote_name
+	
+	return {
+		'plan': qn(Plan._meta.db_table),
+		'logentry': qn(LogEntry._meta.db_table),
+		'entry': qn(ActionEntry._meta.db_table),
+		'action': qn(Action._meta.db_table),
+		'claim': qn(RewardClaim._meta.db_table),
+		'reward': qn(Reward._meta.db_table)
+	}
+
+# The points earned and claimed by a plan. The earned points must follow the
+# same rule as ActionEntry.calculate_points
+EARNED_SQL = """SUM(
+		CASE WHEN a.kind = 'sc' AND ae.value IS NOT NULL
+		THEN ae.value * a.points ELSE a.points END
+	) AS points
+	FROM %(entry)s ae
+	INNER JOIN %(logentry)s le ON le.id = ae.logentry_ptr_id
+	INNER JOIN %(action)s a ON a.id = ae.action_id"""
+
+CLAIMED_SQL = """SUM(r.points) AS points
+	FROM %(claim)s rc
+	INNER JOIN %(logentry)s le ON le.id = rc.logentry_ptr_id
+	INNER JOIN %(reward)s r ON r.id = rc.reward_id"""
+
+def drift(plan = None):
+	"""
+	Compare every plan's point totals with the totals worked out from its
+	action entries and reward claims, in a single query. Returns a list of
+	(plan ID, points, unclaimed points, expected points, expected unclaimed
+	points) tuples for the plans whose totals are wrong.
+	"""
+	
+	names = tables()
+	where = ''
+	params = []
+	
+	if not plan is None:
+		where = 'WHERE le.plan_id = %s'
+		params = [plan.pk, plan.pk, plan.pk]
+	
+	sql = """SELECT id, points, points_unclaimed, expected_points,
+		expected_points - claimed_points
+	FROM (
+		SELECT p.id, p.points, p.points_unclaimed,
+			COALESCE(e.points, 0) AS expected_points,
+			COALESCE(c.points, 0) AS claimed_points
+		FROM %(plan)s p
+		LEFT OUTER JOIN (
+			SELECT le.plan_id, %(earned)s %(where)s GROUP BY le.plan_id
+		) e ON e.plan_id = p.id
+		LEFT OUTER JOIN (
+			SELECT le.plan_id, %(claimed)s %(where)s GROUP BY le.plan_id
+		) c ON c.plan_id = p.id
+		%(plan_where)s
+	) totals
+	WHERE points <> expected_points
+		OR points_unclaimed <> expected_points - claimed_points
+	ORDER BY id""" % {
+		'plan': names['plan'],
+		'earned': EARNED_SQL % names,
+		'claimed': CLAIMED_SQL % names,
+		'where': where,
+		'plan_where': where and 'WHERE p.id = %s' or ''
+	}
+	
+	cursor = connection.cursor()
+	cursor.execute(sql, params)
+	return list(cursor.fetchall())
+
+def repair(ids, chunk_size = 500):
+	"""
+	Set the point totals of the plans with the given IDs from their action
+	entries and reward claims. The totals are worked out inside the UPDATE
+	itself, so entries logged while the repair runs aren't lost.
+	"""
+	
+	names = tables()
+	where = 'WHERE le.plan_id = %(plan)s.id' % names
+	earned = 'COALESCE((SELECT %s %s), 0)' % (EARNED_SQL % names, where)
+	claimed = 'COALESCE((SELECT %s %s), 0)' % (CLAIMED_SQL % names, where)
+	
+	cursor = connection.cursor()
+	updated = 0
+	ids = list(ids)
+	
+	for i in range(0, len(ids), chunk_size):
+		chunk = ids[i:i + chunk_size]
+		cursor.execute(
+			"""UPDATE %(plan)s SET points = %(earned)s,
+				points_unclaimed = %(earned)s - %(claimed)s
+			WHERE id IN (%(ids)s)""" % {
+				'plan': names['plan'],
+				'earned': earned,
+				'claimed': claimed,
+				'ids': ', '.join(['%s'] * len(chunk))
+			},
+			chunk
+		)
+		
+		updated += cursor.rowcount
+	
+	transaction.commit_unless_managed()
+	return updated
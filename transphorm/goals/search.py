@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.db import connection, transaction
+from transphorm.goals.models import Goal, GoalSearchTerm
+import re
+
+# The longest prefix stored in the index. Longer searches are cut down to
+# this length
+MAX_TERM_LENGTH = 30
+
+# Letters and numbers in any script, so accented and non-Latin goal names
+# can be searched
+WORD_RE = re.compile(r'[^\W_]+', re.UNICODE)
+
+def normalise(text):
+	"""
+	Lowercase the text and strip out everything but letters, numbers and
+	single spaces
+	"""
+	
+	return u' '.join(WORD_RE.findall(unicode(text or '').lower()))
+
+def goal_terms(goal):
+	"""
+	Return the set of search terms for a goal: every prefix of its name and
+	slug, starting from each word in turn, so "learn to run" can be found by
+	typing "lea", "to r" or "run"
+	"""
+	
+	terms = set()
+	
+	for text in (goal.name, goal.slug.replace('-', ' ')):
+		words = normalise(text).split()
+		
+		for i in range(len(words)):
+			phrase = u' '.join(words[i:])[:MAX_TERM_LENGTH].rstrip()
+			
+			for j in range(1, len(phrase) + 1):
+				terms.add(phrase[:j].rstrip())
+	
+	return terms
+
+def index_goal(goal):
+	"""
+	Replace the search terms for a goal. Goals that aren't live are taken
+	out of the index.
+	"""
+	
+	GoalSearchTerm.objects.filter(goal = goal).delete()
+	
+	if not goal.live:
+		return
+	
+	cursor = connection.cursor()
+	cursor.executemany(
+		'INSERT INTO %s (goal_id, term) VALUES (%%s, %%s)' % (
+			connection.ops.quote_name(GoalSearchTerm._meta.db_table)
+		),
+		[(goal.pk, term) for term in goal_terms(goal)]
+	)
+	
+	transaction.commit_unless_managed()
+
+def search_goals(query, limit = 10):
+	"""
+	Return the live goals with live plans that start with the query (from
+	any word), most popular first
+	"""
+	
+	query = normalise(query)[:MAX_TERM_LENGTH].rstrip()
+	if not query:
+		return Goal.objects.none()
+	
+	return Goal.objects.filter(
+		search_terms__term = query,
+		live = True,
+		plan_count__gt = 0
+	).order_by('-plan_count', 'name')[:limit]
@@ -0,0 +1,8 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.dispatch import Signal
+
+# Sent by the background spam classifier once it has decided whether a
+# comment is spam. The comment has already been saved by this point.
+comment_classified = Signal(providing_args = ['instance', 'is_spam'])
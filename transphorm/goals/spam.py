@@ -0,0 +1,389 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from transphorm.goals.models import Comment
+from transphorm.goals.signals import comment_classified
+from transphorm.goals.caching import count, get_counts
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+import time, urllib, urllib2, cgi, re, math
+
+AKISMET_URL = 'http://%(key)s.rest.akismet.com/1.1/'
+TOKEN_RE = re.compile(r'[a-z0-9$\'-]+')
+STATS_KEYS = ('cached', 'local', 'remote')
+
+class AkismetError(Exception):
+	pass
+
+class Akismet(object):
+	"""
+	A minimal Akismet client, which gives up on requests that take longer
+	than the given timeout. The API endpoint can be changed with the
+	AKISMET_URL setting, so a stub server can stand in for Akismet.
+	"""
+	
+	def __init__(self, key = None, url = None, timeout = None):
+		self.key = key or getattr(settings, 'AKISMET_KEY')
+		self.url = (
+			url or getattr(settings, 'AKISMET_URL', AKISMET_URL)
+		) % {
+			'key': self.key
+		}
+		
+		self.timeout = timeout or getattr(settings, 'AKISMET_TIMEOUT', 5)
+	
+	def comment_check(self, comment):
+		"""
+		Return True if Akismet thinks the given comment is spam
+		"""
+		
+		from django.contrib.sites.models import Site
+		
+		data = {
+			'blog': 'http://%s/' % Site.objects.get_current().domain,
+			'user_ip': comment.ip,
+			'user_agent': comment.user_agent,
+			'comment_type': 'comment',
+			'comment_author': comment.name,
+			'comment_author_email': comment.email,
+			'comment_author_url': comment.website or '',
+			'comment_content': comment.body
+		}
+		
+		data = dict(
+			[(k, unicode(v or '').encode('utf-8')) for (k, v) in data.items()]
+		)
+		
+		request = urllib2.Request(
+			self.url + 'comment-check',
+			urllib.urlencode(data),
+			{
+				'User-Agent': 'transphorm/akismet 0.2'
+			}
+		)
+		
+		try:
+			response = urllib2.urlopen(
+				request, timeout = self.timeout
+			).read().strip()
+		except Exception, ex:
+			raise AkismetError(unicode(ex) or ex.__class__.__name__)
+		
+		if response == 'true':
+			return True
+		elif response == 'false':
+			return False
+		
+		raise AkismetError('Unexpected response: %s' % response)
+
+class CircuitBreaker(object):
+	"""
+	Stops calls to a remote service after a number of consecutive failures.
+	Once the reset timeout has passed, a single call is let through to see
+	whether the service has recovered.
+	"""
+	
+	def __init__(self, threshold = 5, reset_timeout = 60):
+		self.threshold = threshold
+		self.reset_timeout = reset_timeout
+		self.failures = 0
+		self.opened = None
+	
+	@property
+	def is_open(self):
+		if self.opened is None:
+			return False
+		
+		return time.time() - self.opened < self.reset_timeout
+	
+	def allow(self):
+		return not self.is_open
+	
+	def success(self):
+		self.failures = 0
+		self.opened = None
+	
+	def failure(self):
+		self.failures += 1
+		if self.failures >= self.threshold:
+			self.opened = time.time()
+
+def normalise(text):
+	"""
+	Lowercase the text and collapse its whitespace, so that near-identical
+	comments look the same
+	"""
+	
+	return u' '.join(unicode(text or '').lower().split())
+
+def tokenise(comment):
+	"""
+	Split a comment into the tokens used by the spam model. The commenter's
+	IP address, user agent and website are tokens too.
+	"""
+	
+	tokens = set(TOKEN_RE.findall(normalise(comment.body)))
+	tokens.add(u'ip:%s' % comment.ip)
+	tokens.add(u'ua:%s' % normalise(comment.user_agent))
+	
+	if comment.website:
+		tokens.add(u'url:%s' % normalise(comment.website))
+	
+	return tokens
+
+class SpamModel(object):
+	"""
+	A naive Bayes model of which tokens appear in spam and which appear in
+	genuine comments, trained on comments that have already been marked as
+	spam or approved
+	"""
+	
+	def __init__(self):
+		self.spam = {}
+		self.ham = {}
+		self.spam_count = 0
+		self.ham_count = 0
+		self.trained = None
+	
+	def learn(self, comment, is_spam):
+		if is_spam:
+			counts = self.spam
+			self.spam_count += 1
+		else:
+			counts = self.ham
+			self.ham_count += 1
+		
+		for token in tokenise(comment):
+			counts[token] = counts.get(token, 0) + 1
+	
+	def train(self):
+		self.__init__()
+		
+		comments = Comment.objects.filter(
+			Q(is_spam = True) | Q(is_approved = True)
+		).order_by()
+		
+		for comment in comments.iterator():
+			self.learn(comment, comment.is_spam)
+		
+		self.trained = time.time()
+	
+	def spam_probability(self, comment):
+		"""
+		Return the probability that the comment is spam, between 0 and 1
+		"""
+		
+		total = float(self.spam_count + self.ham_count)
+		log_spam = math.log((self.spam_count + 1) / (total + 2))
+		log_ham = math.log((self.ham_count + 1) / (total + 2))
+		
+		for token in tokenise(comment):
+			spam = self.spam.get(token, 0)
+			ham = self.ham.get(token, 0)
+			
+			# Ignore tokens we've never seen before
+			if spam + ham == 0:
+				continue
+			
+			log_spam += math.log((spam + 1) / (self.spam_count + 2.0))
+			log_ham += math.log((ham + 1) / (self.ham_count + 2.0))
+		
+		try:
+			return 1 / (1 + math.exp(log_ham - log_spam))
+		except OverflowError:
+			return 0.0
+
+class PreFilter(object):
+	"""
+	Decides whether a comment is spam locally, where it can. Verdicts are
+	cached against a hash of the comment's normalised body and the IP address
+	it came from, so repeated comments don't need checking again. Otherwise
+	the spam model is used, but only when it's confident either way.
+	"""
+	
+	def __init__(self, model = None):
+		self.model = model or SpamModel()
+		self.min_examples = getattr(settings, 'SPAM_MODEL_MIN_EXAMPLES', 20)
+		self.max_age = getattr(settings, 'SPAM_MODEL_MAX_AGE', 60 * 60)
+		self.threshold = getattr(settings, 'SPAM_MODEL_THRESHOLD', 0.99)
+		self.verdict_timeout = getattr(
+			settings, 'SPAM_VERDICT_TIMEOUT', 60 * 60 * 24 * 7
+		)
+	
+	def cache_key(self, comment):
+		from django.utils.hashcompat import sha_constructor
+		
+		return 'spam_verdict_%s' % sha_constructor(
+			(u'%s|%s' % (comment.ip, normalise(comment.body))).encode('utf-8')
+		).hexdigest()
+	
+	def check(self, comment):
+		"""
+		Return True or False if the comment can be classified locally, or
+		None if it needs checking with Akismet
+		"""
+		
+		is_spam = cache.get(self.cache_key(comment))
+		if not is_spam is None:
+			count('spam_cached')
+			return is_spam
+		
+		model = self.model
+		if model.trained is None or time.time() - model.trained > self.max_age:
+			model.train()
+		
+		if min(model.spam_count, model.ham_count) >= self.min_examples:
+			probability = model.spam_probability(comment)
+			
+			if probability >= self.threshold:
+				is_spam = True
+			elif probability <= 1 - self.threshold:
+				is_spam = False
+		
+		# Comments left undecided are counted by the classifier, only if it
+		# actually asks Akismet about them
+		if not is_spam is None:
+			count('spam_local')
+			self.remember(comment, is_spam)
+		
+		return is_spam
+	
+	def remember(self, comment, is_spam):
+		cache.set(self.cache_key(comment), is_spam, self.verdict_timeout)
+
+def prefilter_stats():
+	"""
+	Return the number of comments classified from the verdict cache, by the
+	local spam model and by Akismet, along with the ratio of comments that
+	didn't need to go to Akismet
+	"""
+	
+	stats = get_counts(*['spam_%s' % k for k in STATS_KEYS])
+	stats = dict([(k, stats['spam_%s' % k]) for k in STATS_KEYS])
+	
+	total = sum(stats.values())
+	if total > 0:
+		stats['hit_ratio'] = (stats['cached'] + stats['local']) / float(total)
+	else:
+		stats['hit_ratio'] = 0.0
+	
+	return stats
+
+class Classifier(object):
+	"""
+	Checks comments that are waiting to be classified, in batches. Comments
+	go through the local pre-filter first, and only the ones it isn't sure
+	about are checked against Akismet. Comments that can't be checked
+	(because Akismet is slow or down) are left pending, to be tried again
+	with the next batch.
+	"""
+	
+	def __init__(self, api = None, breaker = None, batch_size = None,
+		prefilter = None):
+		self.api = api or Akismet()
+		self.prefilter = prefilter or PreFilter()
+		self.breaker = breaker or CircuitBreaker(
+			getattr(settings, 'AKISMET_FAILURE_THRESHOLD', 5),
+			getattr(settings, 'AKISMET_RESET_TIMEOUT', 60)
+		)
+		
+		self.batch_size = batch_size or getattr(
+			settings, 'AKISMET_BATCH_SIZE', 50
+		)
+	
+	def pending(self):
+		return Comment.objects.filter(
+			is_classified = False
+		).order_by('date')
+	
+	def classify(self, comment, is_spam):
+		comment.is_spam = is_spam
+		comment.is_classified = True
+		comment.save()
+		
+		comment_classified.send(
+			sender = Comment, instance = comment, is_spam = is_spam
+		)
+	
+	def check(self, comment):
+		"""
+		Return True or False depending on whether the comment is spam, or
+		None if the comment couldn't be checked
+		"""
+		
+		is_spam = self.prefilter.check(comment)
+		if not is_spam is None:
+			return is_spam
+		
+		if not self.breaker.allow():
+			return None
+		
+		count('spam_remote')
+		
+		try:
+			is_spam = self.api.comment_check(comment)
+		except AkismetError:
+			self.breaker.failure()
+			return None
+		
+		self.breaker.success()
+		self.prefilter.remember(comment, is_spam)
+		return is_spam
+	
+	def run(self):
+		"""
+		Classify a batch of pending comments. Returns a tuple of the
+		comments that were classified and those left pending.
+		"""
+		
+		classified = []
+		skipped = []
+		
+		for comment in self.pending()[:self.batch_size]:
+			is_spam = self.check(comment)
+			
+			if is_spam is None:
+				skipped.append(comment)
+			else:
+				self.classify(comment, is_spam)
+				classified.append(comment)
+		
+		return classified, skipped
+
+class StubAkismetHandler(BaseHTTPRequestHandler):
+	"""
+	Answers Akismet API requests without talking to Akismet. Like the real
+	service, comments from an author named "viagra-test-123" are always
+	spam.
+	"""
+	
+	def do_POST(self):
+		length = int(self.headers.getheader('content-length') or 0)
+		data = cgi.parse_qs(self.rfile.read(length))
+		
+		if self.path.endswith('/verify-key'):
+			response = 'valid'
+		elif self.path.endswith('/comment-check'):
+			author = data.get('comment_author', [''])[0]
+			if author == 'viagra-test-123':
+				response = 'true'
+			else:
+				response = 'false'
+		else:
+			self.send_error(404)
+			return
+		
+		self.send_response(200)
+		self.send_header('Content-Type', 'text/plain')
+		self.end_headers()
+		self.wfile.write(response)
+
+def stub_server(host = 'localhost', port = 8001):
+	"""
+	Return an HTTP server that stands in for Akismet. Point the AKISMET_URL
+	setting at http://<host>:<port>/1.1/ to use it.
+	"""
+	
+	return HTTPServer((host, port), StubAkismetHandler)
@@ -0,0 +1 @@
+CREATE INDEX goals_logentry_plan_visibility_date ON goals_logentry (plan_id, visibility, date);
@@ -0,0 +1 @@
+CREATE VIRTUAL TABLE goals_logentry_fts USING fts5(body);
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.template import Library, Node, Variable, TemplateSyntaxError
+from django.core.cache import cache
+from transphorm.goals.caching import get_versions, count, get_counts
+
+register = Library()
+
+# Number of seconds to keep a rendered entry. Entries are invalidated by
+# bumping their version, so this can be long
+FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+def version_names(entry):
+	return ('entry_%s' % entry.pk, 'profile_%s' % entry.plan.user_id)
+
+def fragment_variant(entry, user, solo = False):
+	"""
+	Return which rendering of an entry a user sees. The plan's owner gets
+	links to delete and approve entries, which visitors don't, and entries
+	shown on their own page leave them out.
+	"""
+	
+	if user and user.is_authenticated() and user.pk == entry.plan.user_id:
+		variant = 'owner'
+	else:
+		variant = 'visitor'
+	
+	if solo:
+		variant += '_solo'
+	
+	return variant
+
+def fragment_key(entry, variant, versions = None):
+	"""
+	Return the cache key for an entry rendered for the given variant. The key
+	changes whenever the entry, or its author's profile, changes. Pass the
+	versions from get_versions() if they've already been looked up.
+	"""
+	
+	entry_name, profile_name = version_names(entry)
+	if versions is None:
+		versions = get_versions(entry_name, profile_name)
+	
+	return 'entry_fragment_%s_%s_%s_%s' % (
+		entry.pk, versions[entry_name], versions[profile_name], variant
+	)
+
+def prefetch_fragments(request, entries):
+	"""
+	Look up the cached renderings of a page of entries with one get_many for
+	their versions and another for the fragments, and count the hits and
+	misses once for the whole page. The entrycache tag then uses what was
+	found rather than going to the cache for each entry. Returns the entries
+	as a list.
+	"""
+	
+	entries = list(entries)
+	if request is None or len(entries) == 0:
+		return entries
+	
+	user = getattr(request, 'user', None)
+	names = set()
+	for entry in entries:
+		names.update(version_names(entry))
+	
+	versions = get_versions(*names)
+	keys = {}
+	
+	for entry in entries:
+		variant = fragment_variant(entry, user)
+		keys[(entry.pk, variant)] = fragment_key(entry, variant, versions)
+	
+	fragments = cache.get_many(keys.values())
+	count('entry_fragment_hits', len(fragments))
+	count('entry_fragment_misses', len(keys) - len(fragments))
+	
+	if not hasattr(request, '_entry_fragments'):
+		request._entry_fragments = {}
+	
+	for (ident, key) in keys.items():
+		request._entry_fragments[ident] = (key, fragments.get(key))
+	
+	return entries
+
+def fragment_stats():
+	"""
+	Return the number of entry fragments served from the cache and rendered
+	afresh, along with the hit ratio
+	"""
+	
+	stats = get_counts('entry_fragment_hits', 'entry_fragment_misses')
+	stats = {
+		'hits': stats['entry_fragment_hits'],
+		'misses': stats['entry_fragment_misses']
+	}
+	
+	total = stats['hits'] + stats['misses']
+	if total > 0:
+		stats['hit_ratio'] = stats['hits'] / float(total)
+	else:
+		stats['hit_ratio'] = 0.0
+	
+	return stats
+
+class EntryCacheNode(Node):
+	def __init__(self, nodelist, entry):
+		self.nodelist = nodelist
+		self.entry = Variable(entry)
+	
+	def render(self, context):
+		entry = self.entry.resolve(context)
+		request = context.get('request')
+		user = getattr(request, 'user', None)
+		
+		variant = fragment_variant(entry, user, context.get('solo'))
+		prefetched = getattr(request, '_entry_fragments', {})
+		
+		# Entries looked up by prefetch_fragments have been counted already
+		if (entry.pk, variant) in prefetched:
+			key, html = prefetched[(entry.pk, variant)]
+		else:
+			key = fragment_key(entry, variant)
+			html = cache.get(key)
+			
+			if html is None:
+				count('entry_fragment_misses')
+			else:
+				count('entry_fragment_hits')
+		
+		if html is None:
+			html = self.nodelist.render(context)
+			cache.set(key, html, FRAGMENT_TIMEOUT)
+			
+			if (entry.pk, variant) in prefetched:
+				prefetched[(entry.pk, variant)] = (key, html)
+		
+		return html
+
+@register.tag
+def entrycache(parser, token):
+	"""
+	Cache the rendered contents of the block for a log entry:
+		
+		{% entrycache entry %}...{% endentrycache %}
+	"""
+	
+	bits = token.split_contents()
+	if len(bits) != 2:
+		raise TemplateSyntaxError('%s takes a log entry' % bits[0])
+	
+	nodelist = parser.parse(('endentrycache',))
+	parser.delete_first_token()
+	
+	return EntryCacheNode(nodelist, bits[1])
@@ -1,104 +1,107 @@
 #!/usr/bin/env python
 # encoding: utf-8
 
-from pygooglechart import SimpleLineChart
 from django.template import Library
+from django.core.urlresolvers import reverse
+from django.utils.html import escape
 from grapefruit import Color
 from django.core.cache import cache
 from datetime import datetime, timedelta
-from transphorm.goals.models import ActionEntry
+from transphorm.goals.models import PlanDailyPoints
+from transphorm.goals.charts import chart_name, render_chart
+from transphorm.goals.caching import get_version, acquire_lock, release_lock
 
 register = Library()
 
-@register.simple_tag
-def actions_chart(plan, width = 300, height = 200, colour = '000000', labels = 'no'):
-	cache_key = 'chart_%s' % plan.pk
-	cached_charts = cache.get(cache_key, {})
+# Number of seconds to hold the lock while a chart is rebuilt
+CHART_LOCK_TIMEOUT = 30
+
+# Number of seconds to keep the last good chart, for serving while a new one
+# is being built
+STALE_CHART_TIMEOUT = 60 * 60 * 24 * 7
+
+def build_chart(plan, width, height, colour, labels):
+	today = datetime.today().date()
+	end_date = today + timedelta(days = 1) - timedelta(seconds = 1)
+	start_date = today - timedelta(days = 14)
+
+	# Read the daily totals from the rollup table, so the cost depends on
+	# the number of days shown rather than the number of entries logged
+	totals = PlanDailyPoints.objects.filter(
+		plan = plan,
+		day__range = (start_date, today)
+	).order_by().values_list(
+		'day', 'action__pk', 'points'
+	)
 	
-	size_key = '%dx%d_%s_%s' % (width, height, colour, labels)
-	cached_chart_size = cached_charts.get(size_key)
+	data_dict = {}
+	for (day, action_id, points) in totals:
+		data_dict.setdefault(action_id, {})[day] = points
 	
-	if not cached_chart_size:
-		print 'Adding to cache'
-		today = datetime.today().date()
-		end_date = today + timedelta(days = 1) - timedelta(seconds = 1)
-		start_date = today - timedelta(days = 14)
-		days_between = (end_date - start_date).days
+	date_range = [
+		start_date + timedelta(days = d)
+		for d in range((end_date - start_date).days)
+	]
 	
-		query = ActionEntry.objects.filter(
-			plan = plan,
-			date__range = (start_date, end_date)
-		)
-		
-		dates = query.dates('date', 'day')
-		
-		data_dict = {}
-		top_value = 0
-		
-		for date in dates:
-			data = query.filter(
-				date__year = date.year,
-				date__month = date.month,
-				date__day = date.day
-			).values_list(
-				'action__pk', 'value', 'action__points'
-			)
-			
-			for (action_id, value, action_points) in data:
-				chart_data = data_dict.get(
-					action_id, {}
-				)
-				
-				if value and int(value) > 0:
-					points = value * action_points
-				else:
-					points = action_points
-				
-				key = date.date()
-				total = chart_data.get(key, 0) + points
-				
-				if total > top_value:
-					top_value = total
-				
-				chart_data[key] = total
-				data_dict[action_id] = chart_data
-		
-		chart = SimpleLineChart(width, height)
-		
-		date_range = [
-			start_date + timedelta(days = d)
-			for d in range((end_date - start_date).days)
+	if labels == 'yes':
+		axis_labels = [
+			str(d.strftime('%d')) for d in date_range
 		]
+	else:
+		axis_labels = None
+	
+	series = []
+	for key, data in sorted(data_dict.items()):
+		day_data = []
+		for date in date_range:
+			value = data.get(date, 0)
+			day_data.append(value)
 		
-		if labels == 'yes':
-			chart.set_axis_labels(
-				'x',
-				[
-					str(d.strftime('%d')) for d in date_range
-				]
-			)
-		
-		colours = []
-		for key, data in data_dict.items():
-			day_data = []
-			for date in date_range:
-				value = data.get(date, 0)
-				day_data.append(value)
-			
-			chart.add_data(tuple(day_data))
-		
-		colours = Color.NewFromHtml(colour).TetradicScheme()
-		colours = (colour,) + tuple(
-			[colour.RgbToHtml(*colour.rgb)[1:] for colour in colours]
-		)
-		
-		chart.set_colours(colours)
-		cached_chart_size = '<img src="%s" alt="%s\'s %s progress chart"' % (
-			chart.get_url(), plan.user.get_full_name() or plan.user.username,
-			plan.goal.name
-		)
-		
-		cached_charts[size_key] = cached_chart_size
-		cache.set(cache_key, cached_charts)
+		series.append(day_data)
+	
+	colours = Color.NewFromHtml(colour).TetradicScheme()
+	colours = (colour,) + tuple(
+		[colour.RgbToHtml(*colour.rgb)[1:] for colour in colours]
+	)
+	
+	# Charts are named after their contents, so one is only drawn when
+	# the plan's data has changed since it was last rendered
+	name = chart_name(series, width, height, colours, axis_labels)
+	render_chart(name, series, width, height, colours, axis_labels)
+	
+	return '<img src="%s" width="%d" height="%d" alt="%s\'s %s progress chart" />' % (
+		reverse('chart_image', args = [name]), width, height,
+		escape(plan.user.get_full_name() or plan.user.username),
+		escape(plan.goal.name)
+	)
+
+@register.simple_tag
+def actions_chart(plan, width = 300, height = 200, colour = '000000', labels = 'no'):
+	# The plan's data version is bumped whenever an action is logged or
+	# deleted, so old charts drop out of the cache without being deleted
+	size_key = '%dx%d_%s_%s' % (width, height, colour, labels)
+	version = get_version('plan_data_%s' % plan.pk)
+	cache_key = 'chart_%s_%s_%s' % (plan.pk, version, size_key)
+	stale_key = 'chart_%s_stale_%s' % (plan.pk, size_key)
+	
+	chart = cache.get(cache_key)
+	if chart:
+		return chart
+	
+	# Only one request rebuilds the chart. The others serve the last good
+	# one, if there is one
+	locked = acquire_lock(cache_key, CHART_LOCK_TIMEOUT)
+	if not locked:
+		chart = cache.get(stale_key)
+		if chart:
+			return chart
+	
+	try:
+		chart = build_chart(plan, width, height, colour, labels)
+		cache.set(cache_key, chart)
+		cache.set(stale_key, chart, STALE_CHART_TIMEOUT)
+	finally:
+		if locked:
+			release_lock(cache_key)
 	
-	return cached_chart_size
\ No newline at end of file
+	return chart
\ No newline at end of file
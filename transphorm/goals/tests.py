@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+from django.test import TestCase, TransactionTestCase
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, reset_queries
+from django.contrib.auth.models import User
+from datetime import datetime, timedelta
+from transphorm.goals.models import Goal, Plan, Action, ActionEntry, Comment, \
+	Profile, Reward, RewardClaim
+try:
+	from unittest import skipIf
+except ImportError:
+	def skipIf(condition, reason):
+		"""
+		Python 2.6's unittest can't skip tests, so leave them out instead
+		"""
+		
+		def decorator(func):
+			if condition:
+				return lambda self: None
+			
+			return func
+		
+		return decorator
+
+import shutil, tempfile
+
+def create_plan(username):
+	"""
+	Create a user with a public profile, and a plan with one simple action.
+	Returns the plan and the action.
+	"""
+	
+	user = User.objects.create(
+		username = username,
+		email = '%s@example.com' % username
+	)
+	
+	Profile.objects.create(user = user)
+	goal = Goal.objects.create(
+		user = user,
+		name = 'Run a marathon %s' % username,
+		description = 'Run 26 miles.'
+	)
+	
+	plan = Plan.objects.create(goal = goal, user = user)
+	action = Action.objects.create(
+		plan = plan,
+		kind = 'sa',
+		name = 'went for a run',
+		points = 10
+	)
+	
+	return plan, action
+
+def in_memory_database():
+	"""
+	SQLite test databases are kept in memory unless TEST_NAME is set, and
+	then each thread gets a database of its own
+	"""
+	
+	database = settings.DATABASES['default']
+	return 'sqlite' in database['ENGINE'] and database.get('TEST_NAME') in (
+		None, '', ':memory:'
+	)
+
+def count_queries(func, *args, **kwargs):
+	"""
+	Call a function and return the number of database queries it ran. The
+	test runner turns DEBUG off, and Django only logs queries when it's on.
+	"""
+	
+	debug = settings.DEBUG
+	settings.DEBUG = True
+	reset_queries()
+	
+	try:
+		func(*args, **kwargs)
+		return len(connection.queries)
+	finally:
+		settings.DEBUG = debug
+		reset_queries()
+
+class MediaTestCase(TestCase):
+	"""
+	Renders charts into a temporary MEDIA_ROOT, and starts each test with an
+	empty cache
+	"""
+	
+	def setUp(self):
+		self.media_root = settings.MEDIA_ROOT
+		settings.MEDIA_ROOT = tempfile.mkdtemp()
+		cache.clear()
+	
+	def tearDown(self):
+		shutil.rmtree(settings.MEDIA_ROOT)
+		settings.MEDIA_ROOT = self.media_root
+
+class ChartTests(MediaTestCase):
+	def chart_queries(self, plan):
+		from transphorm.goals.templatetags.goalcharts import actions_chart
+		
+		# Start from a fresh copy of the plan, as a page would
+		plan = Plan.objects.get(pk = plan.pk)
+		return count_queries(actions_chart, plan)
+	
+	def test_queries_dont_grow_with_days(self):
+		now = datetime.now()
+		one_day, action = create_plan('oneday')
+		for i in range(14):
+			ActionEntry.objects.create(
+				plan = one_day, action = action, date = now
+			)
+		
+		fortnight, action = create_plan('fortnight')
+		for i in range(14):
+			ActionEntry.objects.create(
+				plan = fortnight, action = action,
+				date = now - timedelta(days = i)
+			)
+		
+		self.assertEqual(
+			self.chart_queries(one_day),
+			self.chart_queries(fortnight)
+		)
+
+class SpamTests(TestCase):
+	"""
+	Runs the classifier against the stub Akismet server
+	"""
+	
+	def setUp(self):
+		from threading import Thread
+		from transphorm.goals.spam import stub_server
+		
+		cache.clear()
+		self.server = stub_server(port = 0)
+		Thread(target = self.server.serve_forever).start()
+		
+		self.plan, action = create_plan('spam')
+	
+	def tearDown(self):
+		self.server.shutdown()
+		self.server.server_close()
+	
+	def akismet(self, port = None, timeout = 5):
+		from transphorm.goals.spam import Akismet
+		
+		return Akismet(
+			key = 'test',
+			url = 'http://localhost:%d/1.1/' % (
+				port or self.server.server_address[1]
+			),
+			timeout = timeout
+		)
+	
+	def comment(self, name):
+		# Verdicts are cached by body, so each comment says something new
+		return Comment.objects.create(
+			plan = self.plan,
+			body = 'Nice work, from %s!' % name,
+			name = name,
+			email = 'visitor@example.com'
+		)
+	
+	def test_classify(self):
+		from transphorm.goals.spam import Classifier
+		
+		spam = self.comment('viagra-test-123')
+		ham = self.comment('Visitor')
+		
+		classified, skipped = Classifier(self.akismet()).run()
+		self.assertEqual(len(classified), 2)
+		self.assertEqual(skipped, [])
+		
+		self.assertTrue(Comment.objects.get(pk = spam.pk).is_spam)
+		self.assertFalse(Comment.objects.get(pk = ham.pk).is_spam)
+	
+	def test_timeout_opens_breaker(self):
+		from transphorm.goals.spam import Classifier, CircuitBreaker, \
+			prefilter_stats
+		import socket
+		
+		# A server that accepts connections but never answers
+		silent = socket.socket()
+		silent.bind(('localhost', 0))
+		silent.listen(5)
+		
+		try:
+			comment = self.comment('Visitor')
+			classifier = Classifier(
+				self.akismet(silent.getsockname()[1], timeout = 0.5),
+				CircuitBreaker(threshold = 1, reset_timeout = 60)
+			)
+			
+			classified, skipped = classifier.run()
+		finally:
+			silent.close()
+		
+		self.assertEqual(classified, [])
+		self.assertEqual(skipped, [comment])
+		self.assertTrue(classifier.breaker.is_open)
+		self.assertFalse(Comment.objects.get(pk = comment.pk).is_classified)
+		
+		# While the breaker is open, Akismet isn't asked even once it's back
+		classifier.api = self.akismet()
+		classified, skipped = classifier.run()
+		self.assertEqual(classified, [])
+		self.assertEqual(skipped, [comment])
+		
+		# Once the reset timeout has passed, the next call goes through
+		classifier.breaker.opened -= 60
+		classified, skipped = classifier.run()
+		self.assertEqual(classified, [comment])
+		self.assertTrue(classifier.breaker.allow())
+		
+		# Only the calls actually made count as going to Akismet
+		self.assertEqual(prefilter_stats()['remote'], 2)
+
+class LogbookTests(MediaTestCase):
+	def logbook_queries(self, plan):
+		from django.core.urlresolvers import reverse
+		
+		url = reverse(
+			'user_plan_logbook', args = [plan.goal.slug, plan.user.username]
+		)
+		
+		# Nothing should come from the cache, or the first page viewed would
+		# run more queries than the second
+		cache.clear()
+		response = []
+		queries = count_queries(lambda: response.append(self.client.get(url)))
+		self.assertEqual(response[0].status_code, 200)
+		
+		return queries
+	
+	def test_queries_dont_grow_with_entries(self):
+		short, action = create_plan('short')
+		ActionEntry.objects.create(plan = short, action = action)
+		
+		long, action = create_plan('long')
+		for i in range(10):
+			ActionEntry.objects.create(plan = long, action = action)
+			Comment.objects.create(
+				plan = long,
+				body = 'Keep it up!',
+				name = 'Visitor %d' % i,
+				email = 'visitor%d@example.com' % i,
+				is_approved = True,
+				is_classified = True
+			)
+		
+		self.assertEqual(
+			self.logbook_queries(short),
+			self.logbook_queries(long)
+		)
+
+class PointsTests(TransactionTestCase):
+	"""
+	These run against committed data, so that other threads can see it
+	"""
+	
+	@skipIf(
+		in_memory_database(),
+		'Threads need a shared database; set TEST_NAME to test on SQLite'
+	)
+	def test_concurrent_entries_and_claims(self):
+		from threading import Thread
+		from django.db import transaction
+		
+		plan, action = create_plan('concurrent')
+		reward = Reward.objects.create(plan = plan, name = 'Cake', points = 10)
+		threads = 5
+		entries = 10
+		claims = 5
+		errors = []
+		
+		# Each thread logs actions and claims rewards through the models, so
+		# the totals are updated by the post_save handlers, one request at a
+		# time as the views would
+		@transaction.commit_on_success
+		def save(entry):
+			entry.save()
+		
+		def log(plan, action, reward):
+			try:
+				for i in range(entries):
+					save(ActionEntry(plan = plan, action = action))
+				
+				for i in range(claims):
+					save(RewardClaim(plan = plan, reward = reward))
+			except Exception, ex:
+				errors.append(ex)
+			finally:
+				connection.close()
+		
+		# Each thread gets its own copies of the objects, loaded before any
+		# points are added, as concurrent requests would
+		workers = [
+			Thread(
+				target = log,
+				args = [
+					Plan.objects.get(pk = plan.pk),
+					Action.objects.get(pk = action.pk),
+					Reward.objects.get(pk = reward.pk)
+				]
+			) for i in range(threads)
+		]
+		
+		for worker in workers:
+			worker.start()
+		
+		for worker in workers:
+			worker.join()
+		
+		self.assertEqual(errors, [])
+		
+		plan.refresh_points()
+		self.assertEqual(plan.points, threads * entries * 10)
+		self.assertEqual(
+			plan.points_unclaimed, threads * (entries - claims) * 10
+		)
\ No newline at end of file
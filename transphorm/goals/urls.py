@@ -11,16 +11,21 @@ urlpatterns = patterns('transphorm.goals.views',
 	url(r'^start/$', 'start', name = 'start'),
 	url(r'^new/start/$', 'new_goal', name = 'new_goal'),
 	url(r'^cron/$', 'cron', name = 'cron'),
+	url(r'^goals/search/$', 'goal_search', name = 'goal_search'),
+	url(r'^charts/(?P<name>[0-9a-f]{40})\.svg$', 'chart_image', name = 'chart_image'),
 	url(r'^(?P<goal>[\w-]+)/$', 'plan_logbook', name = 'plan_logbook'),
 	url(r'^(?P<goal>[\w-]+)/start/$', 'start_plan', name = 'start_plan'),
 	url(r'^(?P<goal>[\w-]+)/log/$', 'plan_logbook_add', name = 'plan_logbook_add'),
+	url(r'^(?P<goal>[\w-]+)/log/batch/$', 'plan_logbook_add_batch', name = 'plan_logbook_add_batch'),
 	url(r'^(?P<goal>[\w-]+)/edit/$', 'edit_plan', name = 'edit_plan'),
 	url(r'^(?P<goal>[\w-]+)/actions/$', 'actions_edit', name = 'actions_edit'),
 	url(r'^(?P<goal>[\w-]+)/rewards/$', 'rewards_edit', name = 'rewards_edit'),
 	url(r'^(?P<goal>[\w-]+)/rewards/(?P<id>\d+)/$', 'rewards_claim', name = 'rewards_claim'),
 	url(r'^(?P<goal>[\w-]+)/rewards/(?P<id>\d+)/claim/$', 'rewards_claim', {'confirm': True}, name = 'rewards_claim_confirm'),
 	url(r'^(?P<goal>[\w-]+)/milestones/$', 'milestones_edit', name = 'milestones_edit'),
+	url(r'^(?P<goal>[\w-]+)/search/$', 'goal_search_entries', name = 'goal_search_entries'),
 	url(r'^(?P<goal>[\w-]+)/(?P<username>[\w-]+)/$', 'plan_logbook', name = 'user_plan_logbook'),
+	url(r'^(?P<goal>[\w-]+)/(?P<username>[\w-]+)/search/$', 'plan_search', name = 'plan_search'),
 	url(r'^(?P<goal>[\w-]+)/(?P<username>[\w-]+)/(?P<id>\d+)/$', 'plan_logbook_entry', name = 'plan_logbook_entry'),
 	url(r'^(?P<goal>[\w-]+)/(?P<username>[\w-]+)/(?P<id>\d+)/delete/$', 'plan_logbook_entry', {'action': 'delete'}, name = 'plan_logbook_entry_delete'),
 	url(r'^(?P<goal>[\w-]+)/(?P<username>[\w-]+)/(?P<id>\d+)/approve/$', 'plan_logbook_entry', {'action': 'approve'}, name = 'plan_logbook_entry_approve'),
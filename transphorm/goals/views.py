@@ -8,7 +8,8 @@ from django.http import HttpResponseRedirect, Http404, HttpResponse
 from django.core.urlresolvers import reverse
 from transphorm.goals.forms import ProfileForm, StartForm, PlanForm, \
 	GoalForm, SignupForm, ActionFormSet, RewardFormSet, MilestoneFormSet, \
-	LogEntryForm, CommentForm, ActionEntryForm, RewardClaimForm
+	LogEntryForm, CommentForm, ActionEntryForm, RewardClaimForm, \
+	ActionEntryFormSet
 
 from transphorm.goals.models import Profile, Goal, Plan, LogEntry, Comment, Reward
 
@@ -603,13 +604,16 @@ def plan_logbook(request, *args, **kwargs):
 	else:
 		entries = plan.log_entries.not_spam()
 	
-	entries = helpers.paginated(entries, request)
+	# Fetch comments along with their entries, and share the plan (with its
+	# goal and user) between them all, to save a few queries per entry
+	entries = helpers.paginated(entries.select_related('comment'), request)
+	entries.object_list = helpers.prefetch_entries(
+		entries.object_list, plan, request
+	)
 	
 	if request.user != plan.user:
 		try:
-			profile = get_object_or_404(
-				Profile, user = plan.user
-			)
+			profile = plan.user.get_profile()
 			
 			if not profile.public:
 				from django.conf import settings
@@ -709,6 +713,7 @@ def plan_logbook_entry(request, *args, **kwargs):
 	elif action == 'approve':
 		entry.comment.is_approved = True
 		entry.comment.is_spam = False
+		entry.comment.is_classified = True
 		entry.comment.save()
 		
 		request.user.message_set.create(
@@ -785,6 +790,73 @@ def plan_logbook_add(request, *args, **kwargs):
 		RequestContext(request)
 	)
 
+@login_required
+@plan_view(edit = True)
+@require_POST
+def plan_logbook_add_batch(request, *args, **kwargs):
+	"""
+	Log several actions at once, from a formset of action entries. Ajax
+	requests get a JSON response with the number of entries and points
+	logged.
+	"""
+	
+	from django.utils.simplejson import dumps
+	
+	goal = args[0]
+	plan = args[1]
+	formset = ActionEntryFormSet(request.POST, plan = plan)
+	
+	if formset.is_valid():
+		entries = formset.entries()
+		points = helpers.log_actions(plan, entries)
+		
+		if request.is_ajax():
+			return HttpResponse(
+				dumps(
+					{
+						'entries': len(entries),
+						'points': points
+					}
+				),
+				mimetype = 'application/json'
+			)
+		
+		request.user.message_set.create(
+			message = 'Your %d entries have been logged.' % len(entries)
+		)
+		
+		return HttpResponseRedirect(
+			reverse('plan_logbook', args = [goal.slug])
+		)
+	
+	if request.is_ajax():
+		return HttpResponse(
+			dumps(
+				{
+					'errors': [
+						dict(
+							[(k, [unicode(e) for e in v]) for (k, v) in errors.items()]
+						) for errors in formset.errors
+					],
+					'non_form_errors': [
+						unicode(e) for e in formset.non_form_errors()
+					]
+				}
+			),
+			mimetype = 'application/json',
+			status = 400
+		)
+	
+	return render_to_response(
+		'plan/error.html',
+		{
+			'goal': goal,
+			'user': plan.user,
+			'plan': plan,
+		},
+		RequestContext(request)
+	)
+
 @plan_view()
 @require_POST
 def plan_comment_add(request, *args, **kwargs):
@@ -847,4 +919,145 @@ def cron(request):
 		log = helpers.cron(fake_date)
 		return HttpResponse('\n'.join(log), mimetype = 'text/plain')
 	else:
-		return Http404()
\ No newline at end of file
+		return Http404()
+
+def chart_image(request, name):
+	"""
+	Serves a chart rendered by the actions_chart template tag. Charts are
+	named after their contents, so they never change and can be cached for
+	as long as the browser likes.
+	"""
+	
+	from transphorm.goals.charts import chart_path
+	from django.utils.cache import patch_cache_control
+	from django.utils.http import http_date
+	import time
+	
+	try:
+		f = open(chart_path(name))
+	except IOError:
+		raise Http404('Chart not found')
+	
+	try:
+		response = HttpResponse(f.read(), mimetype = 'image/svg+xml')
+	finally:
+		f.close()
+	
+	max_age = 60 * 60 * 24 * 365
+	patch_cache_control(response, public = True, max_age = max_age)
+	response['Expires'] = http_date(time.time() + max_age)
+	
+	return response
+
+@require_GET
+def goal_search(request):
+	"""
+	Returns the goals matching the "q" parameter as JSON, most popular
+	first, for autocompleting the start form
+	"""
+	
+	from transphorm.goals.search import search_goals
+	from django.utils.simplejson import dumps
+	
+	goals = search_goals(request.GET.get('q', ''))
+	
+	return HttpResponse(
+		dumps(
+			[
+				{
+					'id': goal.pk,
+					'name': goal.name,
+					'slug': goal.slug,
+					'plans': goal.plan_count
+				} for goal in goals
+			]
+		),
+		mimetype = 'application/json'
+	)
+
+def search_results(request, entries, context):
+	"""
+	Render the log entries matching the "q" parameter, newest first
+	"""
+	
+	from transphorm.goals.fulltext import search_entries
+	
+	query = request.GET.get('q', '').strip()
+	if query:
+		results = helpers.prefetch_entries(
+			search_entries(entries, query).select_related(
+				'plan__user', 'plan__goal', 'comment'
+			).order_by('-date', '-pk')[:50],
+			request = request
+		)
+	else:
+		results = []
+	
+	context.update(
+		{
+			'query': query,
+			'results': results,
+			'meta_title': ('Search %s' % context['goal'].name,)
+		}
+	)
+	
+	return render_to_response(
+		'plan/search.html',
+		context,
+		RequestContext(request)
+	)
+
+@require_GET
+def goal_search_entries(request, goal):
+	"""
+	Search the public log entries of everyone attempting a goal
+	"""
+	
+	from django.db.models import Q
+	
+	goal = get_object_or_404(Goal, slug = goal)
+	entries = LogEntry.objects.approved().filter(
+		plan__goal = goal, plan__live = True
+	).filter(
+		Q(plan__user__profile__public = True) | Q(plan__user__profile__isnull = True)
+	)
+	
+	return search_results(request, entries, {'goal': goal})
+
+@require_GET
+@plan_view(detail = True)
+def plan_search(request, *args, **kwargs):
+	"""
+	Search a plan's logbook. People can see everything in their own
+	logbook, and only the approved entries in anyone else's public one.
+	"""
+	
+	goal = args[0]
+	plan = args[1]
+	
+	if request.user == plan.user:
+		entries = plan.log_entries.not_spam()
+	else:
+		try:
+			public = plan.user.get_profile().public
+		except Profile.DoesNotExist:
+			public = True
+		
+		if not public:
+			from django.conf import settings
+			return HttpResponseRedirect(
+				'%s?next=%s' % (
+					getattr(settings, 'LOGIN_URL'), request.path
+				)
+			)
+		
+		entries = plan.log_entries.approved()
+	
+	return search_results(
+		request, entries,
+		{
+			'goal': goal,
+			'plan': plan,
+			'user': plan.user
+		}
+	)
\ No newline at end of file
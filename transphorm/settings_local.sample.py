@@ -11,6 +11,10 @@ DATABASES = {
 		'PASSWORD': '',
 		'HOST': '',
 		'PORT': '',
+		
+		# Threaded tests need a test database the threads can share, which
+		# an in-memory SQLite one isn't
+		'TEST_NAME': 'transphorm_test',
 	}
 }
 